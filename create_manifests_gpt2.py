@@ -1,7 +1,16 @@
 import json
 import os
+from weights.pack import load_index, manifest_entries
 
 base_url = "https://torrent-tokens.onrender.com/assets/weights"
+weights_dir = "./assets/weights"
+
+def pack_section(pack_name):
+    """Offsets/shapes from an exported pack, so clients can fetch it in one request or by range."""
+    path = f"{weights_dir}/{pack_name}"
+    if not os.path.exists(path):
+        return None
+    return manifest_entries(load_index(path), f"{base_url}/{pack_name}")
 
 # Main manifest
 manifest = {
@@ -25,6 +34,9 @@ manifest = {
         "merges": "./assets/tokenizer/merges.txt"
     }
 }
+embed_pack = pack_section("embed.pack")
+if embed_pack:
+    manifest["pack"] = embed_pack
 
 with open("./assets/weights/manifest.json", "w") as f:
     json.dump(manifest, f, indent=2)
@@ -48,6 +60,10 @@ for i in range(12):
             "ln2_b": f"{base_url}/layer{i}_ln2_b.bin"
         }
     }
+    # legacy per-file URLs stay in "tensors"; "pack" describes the single-file layout
+    pack = pack_section(f"layer{i}.pack")
+    if pack:
+        layer_manifest["pack"] = pack
     
     with open(f"./assets/weights/manifest_layer{i}.json", "w") as f:
         json.dump(layer_manifest, f, indent=2)
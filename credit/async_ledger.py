@@ -0,0 +1,71 @@
+"""
+MIT – buffered ledger facade for the scheduler's event loop
+Emmanuel Dessallien 2024
+
+`add()` only folds the delta into a per-peer dict, so a commit never touches
+the ledger's lock, JSON encoding or journal from the event loop. A background
+thread hands the aggregated deltas to the Ledger every `interval` seconds
+(one event per peer, however many tiles it finished); the Ledger's own
+flusher then group-commits them. `balance()` includes deltas not yet handed
+over (it waits for a hand-over in progress), and `close()` drains everything.
+"""
+import threading, atexit
+from typing import Dict
+from credit.ledger import Ledger, ledger as default_ledger
+
+class AsyncLedger:
+    def __init__(self, ledger: Ledger = default_ledger, interval: float = 0.25):
+        self.ledger = ledger
+        self.interval = interval
+        self._pending: Dict[str, float] = {}
+        self._lock = threading.Lock()     # guards _pending only; never held across a Ledger call
+        self._drain = threading.Lock()    # held while a batch moves into the ledger, so reads never double count
+        self._stop = threading.Event()
+        self._thread = None
+
+    # ---------- public API ----------
+    def add(self, peer_id: str, credits: float):
+        with self._lock:
+            self._pending[peer_id] = self._pending.get(peer_id, 0.0) + credits
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="ledger-buffer", daemon=True)
+            self._thread.start()
+            atexit.register(self.close)
+
+    def spend(self, peer_id: str, amount: float) -> bool:
+        with self._drain:
+            with self._lock: d = self._pending.pop(peer_id, 0.0)
+            if d: self.ledger.add(peer_id, d)
+            return self.ledger.spend(peer_id, amount)
+
+    def balance(self, peer_id: str) -> float:
+        with self._drain:
+            with self._lock: d = self._pending.get(peer_id, 0.0)
+            return self.ledger.balance(peer_id) + d
+
+    def pending(self) -> int:
+        return len(self._pending)
+
+    def flush(self):
+        """Hand every buffered delta to the ledger and group-commit it."""
+        self._drain_pending()
+        self.ledger.flush()
+
+    def close(self):
+        self._stop.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join()
+        self.flush()
+
+    # ---------- internals ----------
+    def _loop(self):
+        while not self._stop.wait(self.interval):
+            self._drain_pending()
+
+    def _drain_pending(self):
+        # swap the buffer out under _lock, then apply it without: Ledger.add can wait on the
+        # ledger's fsync or a compaction, and add() on the event loop must not wait with it
+        with self._drain:
+            with self._lock: batch, self._pending = self._pending, {}
+            for p, d in batch.items():
+                if d: self.ledger.add(p, d)
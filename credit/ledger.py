@@ -1,31 +1,145 @@
 """
 MIT – off-chain credit ledger (private)
 Emmanuel Dessallien 2024
+
+Storage: `ledger.json` is a snapshot {"seq", "balances"}; every credit event
+after it is appended to `ledger.log` as one JSON line {"s", "p", "d"}.
+Appends are group-committed (one write + fsync per `fsync_interval`) by a
+background flusher, and the journal is folded into a fresh snapshot every
+`compact_every` events. Startup loads the snapshot and replays the tail.
 """
-import json, time, pathlib
+import json, time, pathlib, os, threading, atexit
+from telemetry.metrics import NULL
 
 LEDGER_FILE = pathlib.Path("ledger.json")
+JOURNAL_FILE = pathlib.Path("ledger.log")
 
 class Ledger:
-    def __init__(self):
-        self.data = json.loads(LEDGER_FILE.read_text()) if LEDGER_FILE.exists() else {}
+    def __init__(self, path=LEDGER_FILE, journal=JOURNAL_FILE,
+                 fsync_interval=0.05, compact_every=100_000, metrics=None):
+        self.path = pathlib.Path(path)
+        self.journal_path = pathlib.Path(journal)
+        self.fsync_interval = fsync_interval
+        self.compact_every = compact_every
+        self.data = {}
+        self.seq = 0                  # last event sequence number applied
+        self.snap_seq = 0             # last sequence number folded into the snapshot
+        self._lock = threading.Lock()
+        self._pending = []            # encoded journal lines awaiting group commit
+        self._fh = None
+        self._flusher = None
+        self._stop = threading.Event()
+        self.instrument(metrics or NULL)
+        self._load()
+
+    def instrument(self, reg):
+        """Bind metrics from a telemetry.metrics.Registry (NULL = disabled)."""
+        self._m_events = reg.counter("tt_ledger_events_total", "Credit events journaled")
+        self._m_write = reg.histogram("tt_ledger_write_seconds", "Group-commit write + fsync time")
+        reg.gauge("tt_ledger_pending", "Events awaiting group commit", fn=lambda: len(self._pending))
+        reg.gauge("tt_ledger_peers", "Peers with a balance", fn=lambda: len(self.data))
 
+    # ---------- public API ----------
     def add(self, peer_id: str, credits: float):
-        self.data[peer_id] = self.data.get(peer_id, 0.0) + credits
-        self._save()
+        with self._lock:
+            self.data[peer_id] = self.data.get(peer_id, 0.0) + credits
+            self._append(peer_id, credits)
 
     def spend(self, peer_id: str, amount: float) -> bool:
-        if self.data.get(peer_id, 0.0) >= amount:
-            self.data[peer_id] -= amount
-            self._save()
-            return True
+        with self._lock:
+            if self.data.get(peer_id, 0.0) >= amount:
+                self.data[peer_id] -= amount
+                self._append(peer_id, -amount)
+                return True
         return False
 
     def balance(self, peer_id: str) -> float:
         return self.data.get(peer_id, 0.0)
 
-    def _save(self):
-        LEDGER_FILE.write_text(json.dumps(self.data, indent=2))
+    def flush(self):
+        """Write and fsync every pending event (one group commit)."""
+        with self._lock:
+            self._flush_locked()
+
+    def compact(self):
+        """Fold the journal into a new snapshot and truncate it."""
+        with self._lock:
+            self._compact_locked()
+
+    def close(self):
+        self._stop.set()
+        if self._flusher and self._flusher is not threading.current_thread():
+            self._flusher.join()
+        with self._lock:
+            self._flush_locked()
+            if self._fh:
+                self._fh.close()
+                self._fh = None
+
+    # ---------- internals ----------
+    def _append(self, peer_id: str, delta: float):
+        self.seq += 1
+        self._m_events.inc()
+        self._pending.append(json.dumps({"s": self.seq, "p": peer_id, "d": delta}, separators=(",", ":")) + "\n")
+        if self._flusher is None:
+            self._flusher = threading.Thread(target=self._flush_loop, name="ledger-flush", daemon=True)
+            self._flusher.start()
+            atexit.register(self.close)
+        if self.seq - self.snap_seq >= self.compact_every:
+            self._compact_locked()
+
+    def _flush_loop(self):
+        while not self._stop.wait(self.fsync_interval):
+            with self._lock:
+                self._flush_locked()
+
+    def _flush_locked(self):
+        if not self._pending: return
+        t = time.perf_counter()
+        if self._fh is None:
+            self._fh = open(self.journal_path, "ab")
+        self._fh.write("".join(self._pending).encode())
+        self._fh.flush()
+        os.fsync(self._fh.fileno())
+        self._pending.clear()
+        self._m_write.observe(time.perf_counter() - t)
+
+    def _compact_locked(self):
+        self._flush_locked()
+        tmp = self.path.with_name(self.path.name + ".tmp")
+        with open(tmp, "w") as f:
+            json.dump({"seq": self.seq, "balances": self.data}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
+        self.snap_seq = self.seq
+        # entries <= snap_seq are skipped on replay, so a crash before truncation is harmless
+        if self._fh: self._fh.close()
+        self._fh = open(self.journal_path, "wb")
+
+    def _load(self):
+        if self.path.exists():
+            snap = json.loads(self.path.read_text())
+            if "balances" in snap and "seq" in snap:
+                self.data, self.seq = snap["balances"], snap["seq"]
+            else:
+                self.data = snap      # legacy flat {peer_id: balance} file
+        self.snap_seq = self.seq
+        if not self.journal_path.exists(): return
+        good = 0
+        with open(self.journal_path, "rb") as f:
+            for line in f:
+                try:
+                    ev = json.loads(line)
+                except ValueError:
+                    break             # torn tail from a crash mid-write
+                if not line.endswith(b"\n"): break
+                good += len(line)
+                if ev["s"] <= self.seq: continue
+                self.data[ev["p"]] = self.data.get(ev["p"], 0.0) + ev["d"]
+                self.seq = ev["s"]
+        if good != self.journal_path.stat().st_size:
+            with open(self.journal_path, "r+b") as f: f.truncate(good)
 
 # singleton
-ledger = Ledger()
\ No newline at end of file
+ledger = Ledger()
@@ -0,0 +1,144 @@
+"""
+MIT – NumPy CPU reference forward pass for the exported GPT-2 layers
+Emmanuel Dessallien 2024
+
+Runs the model straight from assets/weights (per-tensor layerN_*.bin files
+or layerN.pack / embed.pack containers), memory-mapped, no copies. Each
+session keeps a per-layer KV cache so incremental decode costs O(seq) per
+token. Sequences in a batch advance in lockstep (same length).
+
+Math matches worker_auto_hp.js: pre-LN blocks, LayerNorm eps 1e-5,
+tanh-GELU, causal softmax attention.
+"""
+import json, math
+import numpy as np
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Dict, List
+
+EPS = 1e-5
+LAYER_TENSORS = ("qkv", "qkv_b", "o", "o_b", "ff1", "ff1_b", "ff2", "ff2_b", "ln1_g", "ln1_b", "ln2_g", "ln2_b")
+MATRICES = {"qkv", "o", "ff1", "ff2"}
+
+def layernorm(x, g, b):
+    mu = x.mean(-1, keepdims=True)
+    var = ((x - mu) ** 2).mean(-1, keepdims=True)
+    return (x - mu) / np.sqrt(var + EPS) * g + b
+
+def gelu(x):
+    return 0.5 * x * (1 + np.tanh(math.sqrt(2 / math.pi) * (x + 0.044715 * x ** 3)))
+
+def open_tensors(weights_dir: Path, manifest: Dict, pack_name: str, names) -> Dict[str, np.ndarray]:
+    """Flat float32 views of `names`, from `pack_name` if present, else the manifest's per-tensor .bin files."""
+    weights_dir = Path(weights_dir)
+    if (weights_dir / pack_name).exists():
+        from weights.pack import WeightPack
+        pack = WeightPack(weights_dir / pack_name)
+        return {n: pack[n].reshape(-1) for n in names}
+    urls = manifest.get("tensors", {})
+    return {n: np.memmap(weights_dir / urls[n].rsplit("/", 1)[-1], dtype=np.float32, mode="r") for n in names}
+
+@dataclass
+class KVCache:
+    k: List[np.ndarray] = field(default_factory=list)   # per layer [B, H, cap, dh]
+    v: List[np.ndarray] = field(default_factory=list)
+    length: int = 0
+
+    def reserve(self, n_layers, batch, heads, dh, need):
+        """Grow every layer's buffers (doubling) to hold `need` positions."""
+        cap = self.k[0].shape[2] if self.k else 0
+        if need <= cap: return
+        new = max(need, 2 * cap, 16)
+        for store in (self.k, self.v):
+            for i in range(n_layers):
+                buf = np.zeros((batch, heads, new, dh), np.float32)
+                if i < len(store):
+                    buf[:, :, :self.length] = store[i][:, :, :self.length]
+                    store[i] = buf
+                else:
+                    store.append(buf)
+
+class GPT2Ref:
+    def __init__(self, weights_dir="assets/weights", layout="out_in"):
+        """`layout`: how matrices are stored; export_gpt2_full.py writes [out, in] ("out_in")."""
+        self.dir = Path(weights_dir)
+        main = json.loads((self.dir / "manifest.json").read_text())
+        d = main["dims"]
+        self.D = d.get("dModel") or d["nEmbd"]
+        self.H = d["nHeads"]
+        self.dh = self.D // self.H
+        self.n_layers = d["nLayers"]
+        self.max_seq = d["maxSeq"]
+        self.layout = layout
+        embed = self._open(main, "embed.pack", ("wte", "wpe", "ln_f_g", "ln_f_b"))
+        self.V = embed["wte"].size // self.D
+        self.wte = embed["wte"].reshape(self.V, self.D)
+        self.wpe = embed["wpe"].reshape(-1, self.D)
+        self.ln_f_g, self.ln_f_b = embed["ln_f_g"], embed["ln_f_b"]
+        self.layers = []
+        for i in range(self.n_layers):
+            mpath = self.dir / f"manifest_layer{i}.json"
+            m = json.loads(mpath.read_text()) if mpath.exists() else {}
+            self.layers.append(self._layer(self._open(m, f"layer{i}.pack", LAYER_TENSORS)))
+
+    # ---------- weights ----------
+    def _open(self, manifest: Dict, pack_name: str, names) -> Dict[str, np.ndarray]:
+        return open_tensors(self.dir, manifest, pack_name, names)
+
+    def _layer(self, t: Dict[str, np.ndarray]) -> Dict[str, np.ndarray]:
+        # matrices become [in, out] views so every projection is x @ W
+        D = self.D
+        dims = {"qkv": (D, 3 * D), "o": (D, D), "ff1": (D, t["ff1_b"].size), "ff2": (t["ff1_b"].size, D)}
+        out = dict(t)
+        for name, (fan_in, fan_out) in dims.items():
+            w = t[name]
+            out[name] = w.reshape(fan_out, fan_in).T if self.layout == "out_in" else w.reshape(fan_in, fan_out)
+        return out
+
+    # ---------- inference ----------
+    def new_session(self) -> KVCache:
+        return KVCache()
+
+    def forward(self, tokens, cache: KVCache = None) -> np.ndarray:
+        """tokens [B, T] (or [T]) appended to `cache`; returns final hidden states [B, T, D]."""
+        tokens = np.atleast_2d(np.asarray(tokens))
+        B, T = tokens.shape
+        cache = cache if cache is not None else KVCache()
+        L = cache.length
+        if L + T > self.max_seq: raise ValueError(f"sequence exceeds maxSeq={self.max_seq}")
+        cache.reserve(self.n_layers, B, self.H, self.dh, L + T)
+        x = self.wte[tokens] + self.wpe[L:L + T]
+        # causal mask over the T new rows against all L+T cached positions
+        mask = np.triu(np.full((T, L + T), -np.inf, np.float32), k=L + 1)
+        for i, w in enumerate(self.layers):
+            x = self._block(x, w, cache.k[i], cache.v[i], L, mask)
+        cache.length = L + T
+        return layernorm(x, self.ln_f_g, self.ln_f_b)
+
+    def _block(self, x, w, K, V, L, mask):
+        B, T, D = x.shape
+        qkv = layernorm(x, w["ln1_g"], w["ln1_b"]) @ w["qkv"] + w["qkv_b"]
+        q, k, v = (a.reshape(B, T, self.H, self.dh).transpose(0, 2, 1, 3) for a in np.split(qkv, 3, axis=-1))
+        K[:, :, L:L + T], V[:, :, L:L + T] = k, v
+        att = q @ K[:, :, :L + T].transpose(0, 1, 3, 2) / math.sqrt(self.dh) + mask
+        att = np.exp(att - att.max(-1, keepdims=True))
+        att /= att.sum(-1, keepdims=True)
+        ctx = (att @ V[:, :, :L + T]).transpose(0, 2, 1, 3).reshape(B, T, D)
+        x = x + ctx @ w["o"] + w["o_b"]
+        h = gelu(layernorm(x, w["ln2_g"], w["ln2_b"]) @ w["ff1"] + w["ff1_b"])
+        return x + h @ w["ff2"] + w["ff2_b"]
+
+    def logits(self, h: np.ndarray) -> np.ndarray:
+        return h @ self.wte.T
+
+    def generate(self, tokens, n: int) -> np.ndarray:
+        """Greedy decode `n` tokens after each prompt row (prefill once, then one token per step)."""
+        tokens = np.atleast_2d(np.asarray(tokens))
+        cache = self.new_session()
+        h = self.forward(tokens, cache)
+        out = []
+        for _ in range(n):
+            nxt = self.logits(h[:, -1]).argmax(-1)
+            out.append(nxt)
+            h = self.forward(nxt[:, None], cache)
+        return np.stack(out, axis=1)
@@ -0,0 +1,202 @@
+"""
+MIT – server-side logits head + top-k/top-p sampler over the mmap'd wte
+Emmanuel Dessallien 2024
+
+Takes the last-layer hidden state off coord_hp.js: final LayerNorm, then one
+`h @ wte.T` BLAS matmul for every session waiting on a token instead of a
+scalar 50257x768 loop per session. Sampling selects candidates with
+argpartition (O(V)) and only sorts those, instead of sorting the vocab.
+
+wte can be kept as f32 (fastest), f16 (half the memory) or int8 with
+per-row scales (a quarter); the smaller forms are cached next to the
+weights as wte.<precision>.npy, memory-mapped, and upcast `chunk` vocab rows
+at a time so the working set stays small.
+
+    head = LogitsHead("assets/weights", precision="int8")
+    ids = sample(head.logits(h), temperature=0.8, top_p=0.9)
+
+    python -m engine.logits --synthetic --batch 16       # benchmark
+"""
+import argparse, asyncio, json, time
+import numpy as np
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+from engine.gpt2_ref import layernorm, open_tensors
+
+PRECISIONS = ("f32", "f16", "int8")
+
+class LogitsHead:
+    def __init__(self, weights_dir="assets/weights", precision: str = "f32", chunk: int = 8192,
+                 wte: Optional[np.ndarray] = None, ln_f: Optional[Tuple[np.ndarray, np.ndarray]] = None):
+        """Loads wte/ln_f from embed.pack or the manifest's .bin files; pass `wte`/`ln_f` to use arrays directly."""
+        if precision not in PRECISIONS: raise ValueError(f"precision must be one of {PRECISIONS}")
+        self.dir = Path(weights_dir)
+        self.precision = precision
+        self.chunk = chunk
+        if wte is None:
+            main = json.loads((self.dir / "manifest.json").read_text())
+            d = main["dims"]
+            D = d.get("dModel") or d["nEmbd"]
+            t = open_tensors(self.dir, main, "embed.pack", ("wte", "ln_f_g", "ln_f_b"))
+            wte, ln_f = t["wte"].reshape(-1, D), (t["ln_f_g"], t["ln_f_b"])
+            src = self.dir / "embed.pack" if (self.dir / "embed.pack").exists() else self.dir / "wte.bin"
+        else:
+            src = None
+        self.V, self.D = wte.shape
+        self.ln_f_g, self.ln_f_b = ln_f if ln_f is not None else (np.ones(self.D, np.float32), np.zeros(self.D, np.float32))
+        self.scale = None
+        if precision == "f32":
+            self.wte = wte
+        else:
+            self.wte, self.scale = self._quantized(wte, src)
+
+    def logits(self, h: np.ndarray, normed: bool = False) -> np.ndarray:
+        """[B, D] final hidden states (before ln_f unless `normed`) -> [B, V] float32 logits."""
+        h = np.atleast_2d(np.asarray(h, dtype=np.float32))
+        if not normed: h = layernorm(h, self.ln_f_g, self.ln_f_b).astype(np.float32)
+        if self.precision == "f32": return h @ self.wte.T
+        out = np.empty((h.shape[0], self.V), np.float32)
+        for s in range(0, self.V, self.chunk):
+            e = min(s + self.chunk, self.V)
+            np.matmul(h, self.wte[s:e].astype(np.float32).T, out=out[:, s:e])
+            if self.scale is not None: out[:, s:e] *= self.scale[s:e]
+        return out
+
+    # ---------- internals ----------
+    def _quantized(self, wte: np.ndarray, src: Optional[Path]):
+        path = self.dir / f"wte.{self.precision}.npy"
+        spath = self.dir / "wte.int8.scale.npy"
+        fresh = src is not None and path.exists() and path.stat().st_mtime >= src.stat().st_mtime \
+            and (self.precision != "int8" or spath.exists())
+        if fresh:
+            return np.load(path, mmap_mode="r"), (np.load(spath) if self.precision == "int8" else None)
+        if self.precision == "f16":
+            q, scale = wte.astype(np.float16), None
+        else:
+            # symmetric per-row int8: w ~= q * scale[row]
+            q, scale = np.empty(wte.shape, np.int8), np.empty(self.V, np.float32)
+            for s in range(0, self.V, self.chunk):
+                w = np.asarray(wte[s:s + self.chunk], np.float32)
+                sc = np.maximum(np.abs(w).max(1), 1e-12) / 127.0
+                q[s:s + self.chunk] = np.rint(w / sc[:, None])
+                scale[s:s + self.chunk] = sc
+        if src is not None:
+            np.save(path, q)
+            if scale is not None: np.save(spath, scale)
+            q = np.load(path, mmap_mode="r")
+        return q, scale
+
+def _logsumexp(z: np.ndarray) -> np.ndarray:
+    m = z.max(-1)
+    return m + np.log(np.exp(z - m[:, None]).sum(-1))
+
+def sample(logits: np.ndarray, temperature: float = 1.0, top_k: int = 0, top_p: float = 1.0,
+           rng: Optional[np.random.Generator] = None) -> np.ndarray:
+    """One token id per row. temperature <= 0 is greedy; top_k then top_p filter like coord_hp.js's top_p_sample."""
+    z = np.atleast_2d(np.asarray(logits, dtype=np.float32))
+    B, V = z.shape
+    if temperature <= 0: return z.argmax(-1)
+    rng = rng or np.random.default_rng()
+    z = z / temperature
+    idx = None
+    if (top_k and top_k < V) or top_p < 1.0:
+        lse = None if top_k else _logsumexp(z)      # top_p alone: mass relative to the whole vocab
+        k = min(top_k, V) if top_k else min(64, V)
+        while True:
+            # top-k candidates in O(V) per row; only those k get sorted
+            idx = np.argpartition(-z, k - 1, axis=-1)[:, :k]
+            zk = np.take_along_axis(z, idx, -1)
+            order = np.argsort(-zk, axis=-1)
+            idx, zk = np.take_along_axis(idx, order, -1), np.take_along_axis(zk, order, -1)
+            p = np.exp(zk - (_logsumexp(zk) if top_k else lse)[:, None])
+            cum = np.cumsum(p, -1)
+            if top_k or k == V or (cum[:, -1] >= top_p).all(): break
+            k = min(V, k * 4)                       # some row's nucleus is wider than k: widen and retry
+        if top_p < 1.0:
+            p = np.where(cum - p < top_p, p, 0.0)   # smallest prefix reaching top_p, at least one token
+    else:
+        p = np.exp(z - z.max(-1, keepdims=True))
+    cum = np.cumsum(p, -1)
+    u = rng.random(B) * cum[:, -1]
+    pick = np.minimum((cum < u[:, None]).sum(-1), p.shape[1] - 1)
+    return pick if idx is None else idx[np.arange(B), pick]
+
+class LogitsServer:
+    """Coalesces next-token requests from many sessions into one batched matmul per `window_ms`."""
+    def __init__(self, head: LogitsHead, max_batch: int = 64, window_ms: float = 2.0, seed: Optional[int] = None):
+        self.head = head
+        self.max_batch = max_batch
+        self.window_ms = window_ms
+        self.rng = np.random.default_rng(seed)
+        self._pending: List[Tuple[np.ndarray, Tuple, asyncio.Future]] = []
+        self._timer = None
+        self.batches = 0
+
+    async def next_token(self, h: np.ndarray, temperature: float = 1.0, top_k: int = 0, top_p: float = 1.0) -> int:
+        fut = asyncio.get_running_loop().create_future()
+        self._pending.append((np.asarray(h, np.float32).reshape(-1), (temperature, top_k, top_p), fut))
+        if len(self._pending) >= self.max_batch:
+            self._flush()
+        elif self._timer is None:
+            self._timer = asyncio.get_running_loop().call_later(self.window_ms / 1000.0, self._flush)
+        return await fut
+
+    def _flush(self):
+        if self._timer: self._timer.cancel()
+        self._timer = None
+        batch, self._pending = self._pending, []
+        if not batch: return
+        self.batches += 1
+        # batches can overlap in the executor and a Generator is not thread-safe: each gets its own,
+        # drawn here on the loop thread so a seeded server stays reproducible
+        rng = np.random.default_rng(self.rng.integers(1 << 63))
+        fut = asyncio.get_running_loop().run_in_executor(None, self._run, batch, rng)
+        fut.add_done_callback(lambda f: self._deliver(batch, f))
+
+    def _run(self, batch, rng: np.random.Generator) -> List[int]:
+        # NumPy releases the GIL in matmul, so the loop keeps serving while this runs
+        logits = self.head.logits(np.stack([h for h, _, _ in batch]))
+        groups: Dict[Tuple, List[int]] = {}
+        for i, (_, params, _) in enumerate(batch): groups.setdefault(params, []).append(i)
+        out = [0] * len(batch)
+        for (temperature, top_k, top_p), rows in groups.items():
+            for i, t in zip(rows, sample(logits[rows], temperature, top_k, top_p, rng)): out[i] = int(t)
+        return out
+
+    @staticmethod
+    def _deliver(batch, f):
+        err = f.exception()
+        for i, (_, _, fut) in enumerate(batch):
+            if fut.done(): continue
+            if err: fut.set_exception(err)
+            else: fut.set_result(f.result()[i])
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--dir", default="assets/weights")
+    ap.add_argument("--synthetic", action="store_true", help="random 50257x768 wte instead of the exported one")
+    ap.add_argument("--batch", type=int, default=16, help="sessions sampled together")
+    ap.add_argument("--steps", type=int, default=10)
+    ap.add_argument("--top-p", type=float, default=0.9)
+    args = ap.parse_args()
+    rng = np.random.default_rng(0)
+    wte = rng.standard_normal((50257, 768), dtype=np.float32) * 0.1 if args.synthetic else None
+    h = rng.standard_normal((args.batch, 768), dtype=np.float32)
+    for precision in PRECISIONS:
+        head = LogitsHead(args.dir, precision, wte=wte)
+        head.logits(h[:1])
+        t = time.perf_counter()
+        for _ in range(args.steps): logits = head.logits(h)
+        mm = (time.perf_counter() - t) / args.steps
+        t = time.perf_counter()
+        for _ in range(args.steps): sample(logits, 0.8, top_p=args.top_p, rng=rng)
+        sm = (time.perf_counter() - t) / args.steps
+        mb = (head.wte.nbytes + (head.scale.nbytes if head.scale is not None else 0)) / 2**20
+        print(f"{precision:>5}: wte {mb:6.0f} MB  logits {1000 * mm:7.2f} ms  sample {1000 * sm:6.2f} ms"
+              f"  per token {1000 * (mm + sm) / args.batch:6.3f} ms (batch {args.batch})")
+    t = time.perf_counter()
+    for _ in range(args.steps): np.argsort(-logits, axis=-1)
+    print(f"full-vocab sort (old top-p path): {1000 * (time.perf_counter() - t) / args.steps:.2f} ms per batch")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+MIT – GPT-2 byte-level BPE tokenizer for the Python coordinator path
+Emmanuel Dessallien 2024
+
+Same vocabulary and merges as tokenizer_gpt2.js (assets/tokenizer/tokenizer.json
++ merges.txt), but split the way GPT-2 does it: the pre-tokenizer regex runs on
+the text, then each piece is byte-encoded and merged. Merge ranks are a dict
+keyed by symbol pair, each piece's ids are memoised in an LRU cache, and the
+parsed tables are pickled next to the sources so later startups skip the JSON.
+
+    tok = GPT2Tokenizer.load()
+    ids = tok.encode("Hello world")
+    tok.decode(ids)
+
+The exact GPT-2 split needs the `regex` package (\\p{L}/\\p{N}); without it a
+stdlib `re` approximation is used that agrees on ordinary text.
+"""
+import argparse, json, os, pickle, re, time
+from functools import lru_cache
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+TOKENIZER_DIR = Path(__file__).resolve().parent.parent / "assets" / "tokenizer"
+CACHE_VERSION = 1
+
+try:
+    import regex
+    _PAT = regex.compile(r"""'s|'t|'re|'ve|'m|'ll|'d| ?\p{L}+| ?\p{N}+| ?[^\s\p{L}\p{N}]+|\s+(?!\S)|\s+""")
+except ImportError:
+    # [^\W\d_] = letters, \d = numbers; "other" is anything that is neither (nor whitespace)
+    _PAT = re.compile(r"""'s|'t|'re|'ve|'m|'ll|'d| ?[^\W\d_]+| ?\d+| ?(?:(?![^\W\d_])[^\s\d])+|\s+(?!\S)|\s+""")
+
+def bytes_to_unicode() -> Dict[int, str]:
+    """GPT-2's reversible byte -> printable char map (as in tokenizer_gpt2.js)."""
+    bs = list(range(33, 127)) + list(range(161, 173)) + list(range(174, 256))
+    cs, n = bs[:], 0
+    for b in range(256):
+        if b not in bs:
+            bs.append(b)
+            cs.append(256 + n)
+            n += 1
+    return dict(zip(bs, map(chr, cs)))
+
+class GPT2Tokenizer:
+    def __init__(self, vocab: Dict[str, int], ranks: Dict[Tuple[str, str], int], special: Dict[str, int],
+                 cache_size: int = 65536):
+        self.vocab = vocab
+        self.ranks = ranks                  # (left, right) -> merge priority
+        self.special = special              # added tokens such as <|endoftext|>
+        self.id2tok = {i: t for t, i in vocab.items()}
+        self.id2tok.update({i: t for t, i in special.items()})
+        self.byte_enc = bytes_to_unicode()
+        self.byte_dec = {c: b for b, c in self.byte_enc.items()}
+        self._split_special = re.compile("(" + "|".join(map(re.escape, special)) + ")") if special else None
+        self._piece = lru_cache(maxsize=cache_size)(self._encode_piece)
+
+    # ---------- loading ----------
+    @classmethod
+    def load(cls, tok_dir=TOKENIZER_DIR, cache: bool = True, **kw) -> "GPT2Tokenizer":
+        """Parse tokenizer.json + merges.txt, or reuse the pickle written last time they were parsed."""
+        tok_dir = Path(tok_dir)
+        sources = [tok_dir / "tokenizer.json", tok_dir / "merges.txt"]
+        stamp = [CACHE_VERSION] + [(os.stat(p).st_size, os.stat(p).st_mtime_ns) for p in sources]
+        pkl = tok_dir / "tokenizer.pkl"
+        if cache and pkl.exists():
+            try:
+                with open(pkl, "rb") as f: saved = pickle.load(f)
+                if saved["stamp"] == stamp: return cls(saved["vocab"], saved["ranks"], saved["special"], **kw)
+            except Exception:
+                pass                        # stale or unreadable: rebuild below
+        vocab, ranks, special = cls._parse(*sources)
+        if cache:
+            tmp = pkl.with_suffix(".tmp")
+            with open(tmp, "wb") as f:
+                pickle.dump({"stamp": stamp, "vocab": vocab, "ranks": ranks, "special": special}, f,
+                            protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, pkl)
+        return cls(vocab, ranks, special, **kw)
+
+    @staticmethod
+    def _parse(tokenizer_json: Path, merges_txt: Path):
+        spec = json.loads(tokenizer_json.read_text(encoding="utf-8"))
+        vocab = spec["model"]["vocab"]
+        special = {t["content"]: t["id"] for t in spec.get("added_tokens", []) if t.get("special")}
+        ranks = {}
+        with open(merges_txt, encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("#version"): continue
+                parts = line.split()
+                if len(parts) == 2: ranks[tuple(parts)] = len(ranks)
+        return vocab, ranks, special
+
+    # ---------- public API ----------
+    def encode(self, text: str, special: bool = True) -> List[int]:
+        """Token ids for `text`; added tokens like <|endoftext|> map to their ids unless special=False."""
+        ids = []
+        chunks = self._split_special.split(text) if special and self._split_special else [text]
+        for chunk in chunks:
+            if chunk in self.special and special:
+                ids.append(self.special[chunk])
+                continue
+            for piece in _PAT.findall(chunk):
+                ids.extend(self._piece(piece))
+        return ids
+
+    def encode_batch(self, texts: List[str], special: bool = True) -> List[List[int]]:
+        """Encode many prompts; common words hit the shared cache after the first one."""
+        return [self.encode(t, special) for t in texts]
+
+    def decode(self, ids: List[int]) -> str:
+        text = "".join(self.id2tok.get(i, "") for i in ids)
+        return bytes(self.byte_dec[c] for c in text if c in self.byte_dec).decode("utf-8", errors="replace")
+
+    def cache_info(self):
+        return self._piece.cache_info()
+
+    # ---------- internals ----------
+    def _encode_piece(self, piece: str) -> Tuple[int, ...]:
+        word = [self.byte_enc[b] for b in piece.encode("utf-8")]
+        ranks = self.ranks
+        while len(word) > 1:
+            # merge the lowest-ranked adjacent pair everywhere it occurs
+            best, rank = None, None
+            for pair in zip(word, word[1:]):
+                r = ranks.get(pair)
+                if r is not None and (rank is None or r < rank): best, rank = pair, r
+            if best is None: break
+            a, b = best
+            merged, i = [], 0
+            while i < len(word):
+                if i < len(word) - 1 and word[i] == a and word[i + 1] == b:
+                    merged.append(a + b)
+                    i += 2
+                else:
+                    merged.append(word[i])
+                    i += 1
+            word = merged
+        return tuple(self.vocab[t] for t in word)
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("text", nargs="*", help="text to encode (default: read stdin)")
+    ap.add_argument("--dir", default=str(TOKENIZER_DIR))
+    ap.add_argument("--no-cache", action="store_true", help="parse the sources and skip the pickle")
+    args = ap.parse_args()
+    t = time.perf_counter()
+    tok = GPT2Tokenizer.load(args.dir, cache=not args.no_cache)
+    print(f"loaded {len(tok.vocab)} tokens, {len(tok.ranks)} merges in {1000 * (time.perf_counter() - t):.0f} ms")
+    text = " ".join(args.text) if args.text else __import__("sys").stdin.read()
+    ids = tok.encode(text)
+    print(ids)
+    print(repr(tok.decode(ids)))
+
+if __name__ == "__main__":
+    main()
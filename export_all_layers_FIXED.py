@@ -1,6 +1,7 @@
 import torch
 import numpy as np
 from transformers import AutoModelForCausalLM
+from weights.pack import write_pack
 
 model_name = "distilgpt2"
 print(f"Loading {model_name}...")
@@ -29,19 +30,19 @@ for layer_idx in range(6):
     ln2_g = layer.ln_2.weight.data.numpy().astype(np.float32)
     ln2_b = layer.ln_2.bias.data.numpy().astype(np.float32)
     
-    # Save
-    qkv_weight.tofile(f"assets/weights/layer{layer_idx}_qkv.bin")
-    qkv_bias.tofile(f"assets/weights/layer{layer_idx}_qkv_b.bin")
-    o_weight.tofile(f"assets/weights/layer{layer_idx}_o.bin")
-    o_bias.tofile(f"assets/weights/layer{layer_idx}_o_b.bin")
-    ff1_weight.tofile(f"assets/weights/layer{layer_idx}_ff1.bin")
-    ff1_bias.tofile(f"assets/weights/layer{layer_idx}_ff1_b.bin")
-    ff2_weight.tofile(f"assets/weights/layer{layer_idx}_ff2.bin")
-    ff2_bias.tofile(f"assets/weights/layer{layer_idx}_ff2_b.bin")
-    ln1_g.tofile(f"assets/weights/layer{layer_idx}_ln1_g.bin")
-    ln1_b.tofile(f"assets/weights/layer{layer_idx}_ln1_b.bin")
-    ln2_g.tofile(f"assets/weights/layer{layer_idx}_ln2_g.bin")
-    ln2_b.tofile(f"assets/weights/layer{layer_idx}_ln2_b.bin")
+    # Save as one aligned pack per layer (see weights/pack.py), plus the per-tensor
+    # .bin files the browser clients and the manifest's "tensors" map still point at
+    tensors = {
+        "qkv": qkv_weight, "qkv_b": qkv_bias,
+        "o": o_weight, "o_b": o_bias,
+        "ff1": ff1_weight, "ff1_b": ff1_bias,
+        "ff2": ff2_weight, "ff2_b": ff2_bias,
+        "ln1_g": ln1_g, "ln1_b": ln1_b,
+        "ln2_g": ln2_g, "ln2_b": ln2_b,
+    }
+    write_pack(f"assets/weights/layer{layer_idx}.pack", tensors)
+    for name, arr in tensors.items():
+        arr.tofile(f"assets/weights/layer{layer_idx}_{name}.bin")
     
     print(f"✅ Layer {layer_idx} exported")
 
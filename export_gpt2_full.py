@@ -1,8 +1,14 @@
 import torch
 from transformers import GPT2LMHeadModel
 import numpy as np
-import json
+import argparse
 import os
+from weights.pack import write_pack
+
+ap = argparse.ArgumentParser()
+ap.add_argument("--no-bins", dest="bins", action="store_false",
+                help="skip the one-file-per-tensor .bin set (the browser clients and manifests still load it)")
+args = ap.parse_args()
 
 print("🔄 Loading full GPT-2 (124M params, 12 layers)...")
 model = GPT2LMHeadModel.from_pretrained("gpt2")  # NOT distilgpt2!
@@ -11,61 +17,51 @@ model.eval()
 output_dir = "./assets/weights"
 os.makedirs(output_dir, exist_ok=True)
 
-print("📦 Exporting embeddings...")
-# WTE (50257 vocab × 768 dim)
-wte = model.transformer.wte.weight.detach().cpu().numpy().astype(np.float32)
-wte.tofile(f"{output_dir}/wte.bin")
-print(f"✅ WTE: {wte.shape} -> {wte.nbytes/1024/1024:.1f}MB")
+def f32(t):
+    return t.detach().cpu().numpy().astype(np.float32)
 
-# WPE (1024 positions × 768 dim)
-wpe = model.transformer.wpe.weight.detach().cpu().numpy().astype(np.float32)
-wpe.tofile(f"{output_dir}/wpe.bin")
-print(f"✅ WPE: {wpe.shape} -> {wpe.nbytes/1024/1024:.1f}MB")
+def save(tensors, pack_name, bin_prefix=""):
+    index = write_pack(f"{output_dir}/{pack_name}", tensors)
+    if args.bins:
+        for name, arr in tensors.items():
+            arr.tofile(f"{output_dir}/{bin_prefix}{name}.bin")
+    return index
 
-# Final layer norm
-ln_f_g = model.transformer.ln_f.weight.detach().cpu().numpy().astype(np.float32)
-ln_f_b = model.transformer.ln_f.bias.detach().cpu().numpy().astype(np.float32)
-ln_f_g.tofile(f"{output_dir}/ln_f_g.bin")
-ln_f_b.tofile(f"{output_dir}/ln_f_b.bin")
+print("📦 Exporting embeddings...")
+# WTE (50257 vocab × 768 dim), WPE (1024 positions × 768 dim), final layer norm
+embed = {
+    "wte": f32(model.transformer.wte.weight),
+    "wpe": f32(model.transformer.wpe.weight),
+    "ln_f_g": f32(model.transformer.ln_f.weight),
+    "ln_f_b": f32(model.transformer.ln_f.bias),
+}
+save(embed, "embed.pack")
+print(f"✅ WTE: {embed['wte'].shape} -> {embed['wte'].nbytes/1024/1024:.1f}MB")
+print(f"✅ WPE: {embed['wpe'].shape} -> {embed['wpe'].nbytes/1024/1024:.1f}MB")
 print(f"✅ Final LayerNorm")
 
-# Export all 12 layers
+# Export all 12 layers, one aligned pack per layer
 for i in range(12):
     print(f"\n📥 Exporting layer {i}/12...")
     layer = model.transformer.h[i]
-    
-    qkv_weight = layer.attn.c_attn.weight.detach().cpu().numpy().astype(np.float32).T  # ADD .T
-    qkv_bias = layer.attn.c_attn.bias.detach().cpu().numpy().astype(np.float32)
-    
-    o_weight = layer.attn.c_proj.weight.detach().cpu().numpy().astype(np.float32).T  # ADD .T
-    o_bias = layer.attn.c_proj.bias.detach().cpu().numpy().astype(np.float32)
-    
-    ff1_weight = layer.mlp.c_fc.weight.detach().cpu().numpy().astype(np.float32).T  # ADD .T
-    ff1_bias = layer.mlp.c_fc.bias.detach().cpu().numpy().astype(np.float32)
-    ff2_weight = layer.mlp.c_proj.weight.detach().cpu().numpy().astype(np.float32).T  # ADD .T
-    ff2_bias = layer.mlp.c_proj.bias.detach().cpu().numpy().astype(np.float32)
-    
-    # Layer norms
-    ln1_g = layer.ln_1.weight.detach().cpu().numpy().astype(np.float32)
-    ln1_b = layer.ln_1.bias.detach().cpu().numpy().astype(np.float32)
-    ln2_g = layer.ln_2.weight.detach().cpu().numpy().astype(np.float32)
-    ln2_b = layer.ln_2.bias.detach().cpu().numpy().astype(np.float32)
-    
-    # Save to files
-    qkv_weight.tofile(f"{output_dir}/layer{i}_qkv.bin")
-    qkv_bias.tofile(f"{output_dir}/layer{i}_qkv_b.bin")
-    o_weight.tofile(f"{output_dir}/layer{i}_o.bin")
-    o_bias.tofile(f"{output_dir}/layer{i}_o_b.bin")
-    ff1_weight.tofile(f"{output_dir}/layer{i}_ff1.bin")
-    ff1_bias.tofile(f"{output_dir}/layer{i}_ff1_b.bin")
-    ff2_weight.tofile(f"{output_dir}/layer{i}_ff2.bin")
-    ff2_bias.tofile(f"{output_dir}/layer{i}_ff2_b.bin")
-    ln1_g.tofile(f"{output_dir}/layer{i}_ln1_g.bin")
-    ln1_b.tofile(f"{output_dir}/layer{i}_ln1_b.bin")
-    ln2_g.tofile(f"{output_dir}/layer{i}_ln2_g.bin")
-    ln2_b.tofile(f"{output_dir}/layer{i}_ln2_b.bin")
-    
-    print(f"  ✅ Layer {i} exported")
+
+    tensors = {
+        "qkv": f32(layer.attn.c_attn.weight).T,      # Conv1D stores [in, out]; exported as [out, in]
+        "qkv_b": f32(layer.attn.c_attn.bias),
+        "o": f32(layer.attn.c_proj.weight).T,
+        "o_b": f32(layer.attn.c_proj.bias),
+        "ff1": f32(layer.mlp.c_fc.weight).T,
+        "ff1_b": f32(layer.mlp.c_fc.bias),
+        "ff2": f32(layer.mlp.c_proj.weight).T,
+        "ff2_b": f32(layer.mlp.c_proj.bias),
+        # Layer norms
+        "ln1_g": f32(layer.ln_1.weight),
+        "ln1_b": f32(layer.ln_1.bias),
+        "ln2_g": f32(layer.ln_2.weight),
+        "ln2_b": f32(layer.ln_2.bias),
+    }
+    index = save(tensors, f"layer{i}.pack", f"layer{i}_")
+    print(f"  ✅ Layer {i} exported ({len(index['tensors'])} tensors in layer{i}.pack)")
 
 print("\n🎉 ALL 12 LAYERS EXPORTED!")
 print(f"📁 Files saved to {output_dir}/")
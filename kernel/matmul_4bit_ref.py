@@ -0,0 +1,46 @@
+"""
+MIT – host-side twin of matmul_4bit_wgsl.wgsl for audit sampling
+Emmanuel Dessallien 2024
+
+Works on the block-record tiles written by quantize_4bit.py, decoded by
+kernel.quant4.dequantize with the kernel's  w = q * scale / 7 - meta.
+A weight tile of shape [N, K] applied to activations a [..., K] gives a @ W.T.
+"""
+import json
+import numpy as np
+from pathlib import Path
+from typing import Dict, Optional, Sequence
+from kernel.quant4 import dequantize
+
+def matmul_4bit(a: np.ndarray, blob, shape, group: int) -> np.ndarray:
+    """a [..., K] @ W.T for one packed tile W [N, K]."""
+    return np.asarray(a, np.float32) @ dequantize(blob, shape, group).T
+
+def matmul_4bit_batch(acts: np.ndarray, blobs: Sequence[bytes], shape, group: int) -> np.ndarray:
+    """Many same-shape tiles at once: acts [n, ..., K], n tiles -> [n, ..., N]."""
+    if int(np.prod(shape)) % group == 0:
+        W = dequantize(b"".join(blobs), (len(blobs), *shape), group)    # no per-tile padding: one unpack
+    else:
+        W = np.stack([dequantize(b, shape, group) for b in blobs])
+    return np.einsum("n...k,nmk->n...m", np.asarray(acts, np.float32), W)
+
+class TileAuditor:
+    """Recompute a committed job on the coordinator.
+
+    job.tile_id names the weight tile in tiles/index.json; job.act_blob is
+    float32 activations [..., K]. Returns the expected float32 result bytes,
+    or None when the tile is unknown.
+    """
+    def __init__(self, tiles_dir="tiles"):
+        self.dir = Path(tiles_dir)
+        self.index: Dict[str, Dict] = json.loads((self.dir / "index.json").read_text())
+        self.cache: Dict[int, bytes] = {}
+
+    def __call__(self, job) -> Optional[bytes]:
+        e = self.index.get(str(job.tile_id))
+        if e is None or len(e["shape"]) != 2: return None
+        blob = self.cache.get(job.tile_id)
+        if blob is None:
+            blob = self.cache[job.tile_id] = (self.dir / f"{job.tile_id}.tile").read_bytes()
+        a = np.frombuffer(job.act_blob, np.float32).reshape(-1, e["shape"][1])
+        return matmul_4bit(a, blob, e["shape"], e["group"]).astype(np.float32).tobytes()
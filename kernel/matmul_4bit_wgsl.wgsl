@@ -4,7 +4,7 @@
 struct Tile {
     scale: f32,
     meta: f32,
-    data: array<u32>,   // 2 weights per u32 (lower 4-bit, upper 4-bit)
+    data: array<u32>,   // 8 weights per u32, element 0 in the lowest nibble (kernel/quant4.py records)
 };
 
 @group(0) @binding(0) var<storage, read> A: Tile;   // activations
@@ -20,12 +20,11 @@ fn main(@builtin(global_invocation_id) gid: vec3<u32>) {
 
     var sum: f32 = 0.0;
     for (col in 0u..<TILE_SIZE) {
-        let idx = col >> 1;          // 2 weights per u32
-        let pair = W.data[idx];
-        let w0 = f32(pair & 0x0Fu) * W.scale / 7.0 - W.meta;
-        let w1 = f32((pair >> 4u) & 0x0Fu) * W.scale / 7.0 - W.meta;
+        let word = W.data[col >> 3u];    // 8 weights per u32 (two per byte, little-endian)
+        let q = (word >> ((col & 7u) * 4u)) & 0x0Fu;
+        let w = f32(q) * W.scale / 7.0 - W.meta;
         let a = A.data[col];         // assume activations are 8-bit unpacked for MVP
-        sum += a * (select(w0, w1, col & 1u));
+        sum += a * w;
     }
     C[row] = sum;
 }
\ No newline at end of file
@@ -0,0 +1,81 @@
+"""
+MIT – group-wise 4-bit quantization engine
+Emmanuel Dessallien 2024
+
+A quantized tensor is a run of fixed-size block records. Each record is laid
+out exactly like `struct Tile` in matmul_4bit_wgsl.wgsl (the kernel reads
+`data` as u32 words of eight nibbles), so a record with group = TILE_SIZE (the
+default) can be bound straight to the kernel:
+
+    f32 scale | f32 meta | u8[group/2] packed nibbles   (little-endian)
+
+Nibbles q are unsigned (0..15), two per byte, even element in the low half,
+and decode with the kernel's formula  w = q * scale / 7 - meta.
+  symmetric:  q = round(w / s) + 8,  s = absmax / 7   ->  scale = absmax,   meta = 8 s
+  asymmetric: q = round((w - min) / s), s = range / 15 ->  scale = 7 s,    meta = -min
+"""
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Iterable, Tuple
+
+MODES = ("sym", "asym")
+TILE_SIZE = 256          # elements per tile in matmul_4bit_wgsl.wgsl; other group sizes are host-side only
+
+def record_dtype(group: int) -> np.dtype:
+    if group % 8: raise ValueError("group size must be a multiple of 8 (whole u32 words)")
+    return np.dtype([("scale", "<f4"), ("meta", "<f4"), ("data", "u1", (group // 2,))])
+
+def quantize(w: np.ndarray, group: int = TILE_SIZE, mode: str = "sym") -> bytes:
+    """Flatten `w` and quantize it into group-wise 4-bit block records."""
+    if mode not in MODES: raise ValueError(f"mode must be one of {MODES}")
+    flat = np.ascontiguousarray(w, dtype=np.float32).reshape(-1)
+    pad = -len(flat) % group
+    if pad: flat = np.concatenate([flat, np.zeros(pad, np.float32)])
+    blk = flat.reshape(-1, group)
+    if mode == "sym":
+        absmax = np.abs(blk).max(axis=1)
+        s = np.where(absmax > 0, absmax / 7, 1.0).astype(np.float32)
+        q = np.clip(np.rint(blk / s[:, None]), -8, 7) + 8
+        scale, meta = 7 * s, 8 * s
+    else:
+        lo, hi = blk.min(axis=1), blk.max(axis=1)
+        s = np.where(hi > lo, (hi - lo) / 15, 1.0).astype(np.float32)
+        q = np.clip(np.rint((blk - lo[:, None]) / s[:, None]), 0, 15)
+        scale, meta = 7 * s, -lo
+    q = q.astype(np.uint8)
+    rec = np.empty(len(blk), record_dtype(group))
+    rec["scale"], rec["meta"] = scale, meta
+    rec["data"] = q[:, 0::2] | (q[:, 1::2] << 4)
+    return rec.tobytes()
+
+def unpack(buf, group: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Block records -> (q [blocks, group] uint8, scale [blocks], meta [blocks]) without copying the input."""
+    rec = np.frombuffer(buf, dtype=record_dtype(group))
+    data = rec["data"]
+    q = np.empty((len(rec), group), np.uint8)
+    q[:, 0::2] = data & 0x0F
+    q[:, 1::2] = data >> 4
+    return q, rec["scale"], rec["meta"]
+
+def dequantize(buf, shape, group: int = TILE_SIZE) -> np.ndarray:
+    q, scale, meta = unpack(buf, group)
+    w = q * (scale / 7)[:, None] - meta[:, None]
+    n = int(np.prod(shape))
+    return w.reshape(-1)[:n].astype(np.float32, copy=False).reshape(shape)
+
+def _job(args):
+    name, w, group, mode = args
+    blob = quantize(w, group, mode)
+    err = float(np.abs(dequantize(blob, w.shape, group) - w).max()) if w.size else 0.0
+    return name, blob, err
+
+def quantize_many(tensors: Iterable[Tuple[str, np.ndarray]], group: int = TILE_SIZE, mode: str = "sym",
+                  workers: int = None) -> Iterable[Tuple[str, bytes, float]]:
+    """Quantize tensors across a process pool; yields (name, blob, max_abs_err) in input order."""
+    jobs = ((name, w, group, mode) for name, w in tensors)
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield from pool.map(_job, jobs)
+
+def index_entry(name: str, shape, group: int, mode: str, nbytes: int) -> Dict:
+    return {"name": name, "shape": list(shape), "group": group, "mode": mode,
+            "record_bytes": record_dtype(group).itemsize, "bytes": nbytes}
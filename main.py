@@ -2,12 +2,21 @@
 MIT – private entry point for scheduler + kernel + ledger
 Emmanuel Dessallien 2024
 """
-import asyncio, json
+import argparse, asyncio, json
 from scheduler.ring_scheduler import RingScheduler
+from scheduler.snapshot import Snapshotter
 from credit.ledger import ledger
+from credit.async_ledger import AsyncLedger
+from telemetry.metrics import Registry, NULL, serve
+from telemetry.trace import Tracer
 
-async def demo():
-    sched = RingScheduler()
+async def demo(metrics=NULL, tracer=None, snapshot=None):
+    credits = AsyncLedger(ledger)
+    sched = RingScheduler(metrics=metrics, tracer=tracer, ledger=credits)
+    snap = Snapshotter(sched, snapshot) if snapshot else None
+    if snap:
+        print("Restored jobs:", await snap.restore())
+        snap.start()
     # mock peers
     for i in range(5):
         from scheduler.ring_scheduler import Peer
@@ -17,6 +26,21 @@ async def demo():
     await sched.add_job(tile_id=0, model_id=1, act_blob=b"\x00" * 512)
     await asyncio.sleep(1)
     print("Credits:", sched.credits)
+    if snap: await snap.close()
+    credits.close()
 
 if __name__ == "__main__":
-    asyncio.run(demo())
\ No newline at end of file
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--metrics-port", type=int, help="serve Prometheus metrics on 127.0.0.1:PORT/metrics")
+    ap.add_argument("--trace", metavar="FILE", help="write a Chrome trace of sampled jobs on exit")
+    ap.add_argument("--trace-rate", type=float, default=1.0, help="fraction of jobs traced")
+    ap.add_argument("--snapshot", metavar="PATH", help="restore scheduler state from PATH and snapshot to it")
+    args = ap.parse_args()
+    metrics = NULL
+    if args.metrics_port:
+        metrics = Registry()
+        ledger.instrument(metrics)
+        serve(metrics, args.metrics_port)
+    tracer = Tracer(args.trace_rate) if args.trace else None
+    asyncio.run(demo(metrics, tracer, args.snapshot))
+    if tracer: tracer.dump(args.trace)
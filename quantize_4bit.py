@@ -1,31 +1,51 @@
 """
-MIT  quantize TinyStories-33M → 4-bit tiles for MVP
-pip install torch transformers
+MIT  quantize TinyStories-33M → group-wise 4-bit tiles
+pip install torch transformers numpy
+
+python quantize_4bit.py [--model karpathy/TinyStories-33M] [--group 256] [--mode sym|asym] [--out tiles]
+
+Writes tiles/<id>.tile (block records, see kernel/quant4.py) and
+tiles/index.json mapping tile ids to tensor name/shape/group/mode.
 """
-import torch, struct, os
-from transformers import GPT2LMHeadModel
+import argparse, json, os, sys
+from kernel.quant4 import MODES, TILE_SIZE, index_entry, quantize_many
+
+def state_tensors(model_name):
+    import torch
+    from transformers import GPT2LMHeadModel
+    model = GPT2LMHeadModel.from_pretrained(model_name)
+    for name, param in model.state_dict().items():
+        if not param.is_floating_point():
+            continue
+        yield name, param.detach().to(torch.float32).cpu().numpy()
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--model", default="karpathy/TinyStories-33M")
+    ap.add_argument("--group", type=int, default=TILE_SIZE, help="elements per scale block (the WGSL kernel needs 256)")
+    ap.add_argument("--mode", choices=MODES, default="sym")
+    ap.add_argument("--workers", type=int, default=None)
+    ap.add_argument("--out", default="tiles")
+    args = ap.parse_args()
+    if args.group != TILE_SIZE:
+        print(f"⚠️  --group {args.group} != kernel TILE_SIZE {TILE_SIZE}: tiles are for the host reference only",
+              file=sys.stderr)
 
-model = GPT2LMHeadModel.from_pretrained("karpathy/TinyStories-33M")
-state = model.state_dict()
+    os.makedirs(args.out, exist_ok=True)
+    index, total, shapes = {}, 0, {}
+    def tensors():
+        for name, w in state_tensors(args.model):
+            shapes[name] = w.shape
+            yield name, w
+    for tile_id, (name, blob, err) in enumerate(quantize_many(tensors(), args.group, args.mode, args.workers)):
+        with open(f"{args.out}/{tile_id}.tile", "wb") as f:
+            f.write(blob)
+        index[tile_id] = index_entry(name, shapes[name], args.group, args.mode, len(blob))
+        total += len(blob)
+        print(f"tile {tile_id}: {name} → {len(blob)} B  max|err|={err:.4g}")
+    with open(f"{args.out}/index.json", "w") as f:
+        json.dump(index, f, indent=2)
+    print(f"{total / 1e6:.1f} MB total → {args.out}/ folder ready")
 
-os.makedirs("tiles", exist_ok=True)
-tile_id = 0
-for name, param in state.items():
-    if param.dtype != torch.float32:
-        continue
-    w = param.flatten()
-    w_scale = w.abs().max()
-    w_q = torch.clamp((w / w_scale * 7), -8, 7).round().to(torch.int8)
-    # pack two 4-bit weights into one byte
-    n = w_q.numel()
-    pad = (n % 2)
-    if pad:
-        w_q = torch.cat([w_q, torch.zeros(1, dtype=torch.int8)])
-    packed = (w_q[0::2] & 0x0F) | ((w_q[1::2] & 0x0F) << 4)
-    tile_bytes = packed.cpu().numpy().tobytes()
-    meta = struct.pack(">ff", w_scale, 0.0)
-    with open(f"tiles/{tile_id}.tile", "wb") as f:
-        f.write(meta + tile_bytes)
-    print(f"tile {tile_id}: {name} → {len(tile_bytes)} B")
-    tile_id += 1
-print("8 MB total → tiles/ folder ready")
\ No newline at end of file
+if __name__ == "__main__":
+    main()
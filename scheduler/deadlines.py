@@ -0,0 +1,56 @@
+"""
+MIT – single-task deadline queue for stall detection
+Emmanuel Dessallien 2024
+
+One heap + one asyncio task replaces a sleeping coroutine per dispatched
+job. Re-arming or cancelling a key is O(log n) / O(1): stale heap entries
+are skipped lazily through a per-key generation counter.
+"""
+import asyncio, heapq, itertools
+from typing import Awaitable, Callable, Dict, Hashable, List, Optional, Tuple
+
+class DeadlineQueue:
+    def __init__(self, on_expire: Callable[[Hashable], Awaitable]):
+        self.on_expire = on_expire
+        self.heap: List[Tuple[float, int, Hashable]] = []
+        self.live: Dict[Hashable, int] = {}       # key -> generation of its current deadline
+        self._gen = itertools.count()
+        self._wake = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self):
+        return len(self.live)
+
+    def arm(self, key: Hashable, delay: float):
+        """(Re)set the deadline for `key` to `delay` seconds from now."""
+        loop = asyncio.get_running_loop()
+        gen = next(self._gen)
+        self.live[key] = gen
+        heapq.heappush(self.heap, (loop.time() + delay, gen, key))
+        if self._task is None or self._task.done():
+            self._task = loop.create_task(self._run())
+        elif self.heap[0][1] == gen:
+            self._wake.set()                        # new earliest deadline
+
+    def cancel(self, key: Hashable):
+        self.live.pop(key, None)
+
+    def stop(self):
+        if self._task: self._task.cancel()
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()   # loop clock, so a virtual-time loop drives it too
+        while self.live:
+            while self.heap and self.live.get(self.heap[0][2]) != self.heap[0][1]:
+                heapq.heappop(self.heap)            # cancelled or re-armed
+            if not self.heap: break
+            delay = self.heap[0][0] - loop.time()
+            if delay > 0:
+                self._wake.clear()
+                try: await asyncio.wait_for(self._wake.wait(), delay)
+                except asyncio.TimeoutError: pass
+                continue
+            _, gen, key = heapq.heappop(self.heap)
+            del self.live[key]
+            await self.on_expire(key)
+        self.heap.clear()
@@ -0,0 +1,125 @@
+"""
+MIT – weighted peer sampler for the ring scheduler
+Emmanuel Dessallien 2024
+
+Fenwick (binary indexed) tree over per-peer weights: O(log n) update and
+O(log n) weighted pick, so k distinct picks cost O(k log n).
+"""
+import random
+from typing import Dict, Iterable, List, Optional
+
+class PeerSampler:
+    def __init__(self, capacity: int = 64):
+        self.size = 1
+        while self.size < capacity: self.size <<= 1
+        self.tree = [0.0] * (self.size + 1)     # 1-based Fenwick array
+        self.weights = [0.0] * self.size        # raw weight per slot
+        self.slot: Dict[str, int] = {}
+        self.ids: List[Optional[str]] = [None] * self.size
+        self.free: List[int] = list(range(self.size - 1, -1, -1))
+
+    def __len__(self):
+        return len(self.slot)
+
+    def __contains__(self, peer_id: str):
+        return peer_id in self.slot
+
+    @property
+    def total(self) -> float:
+        return self._prefix(self.size)
+
+    # ---------- mutation ----------
+    def add(self, peer_id: str, weight: float):
+        if peer_id in self.slot:
+            return self.update(peer_id, weight)
+        if not self.free: self._grow()
+        i = self.free.pop()
+        self.slot[peer_id] = i
+        self.ids[i] = peer_id
+        self._set(i, weight)
+
+    def remove(self, peer_id: str):
+        i = self.slot.pop(peer_id, None)
+        if i is None: return
+        self._set(i, 0.0)
+        self.ids[i] = None
+        self.free.append(i)
+
+    def update(self, peer_id: str, weight: float):
+        i = self.slot.get(peer_id)
+        if i is not None: self._set(i, weight)
+
+    # ---------- sampling ----------
+    def sample(self, k: int, exclude: Iterable[str] = (), fill: bool = True) -> List[str]:
+        """k distinct peer ids, weighted, without replacement.
+
+        With fill=False zero-weight peers are never returned, so fewer than k may come back.
+        """
+        taken = [(self.slot[pid], self.weights[self.slot[pid]]) for pid in set(exclude) if pid in self.slot]
+        for i, _ in taken: self._set(i, 0.0)
+        k = min(k, len(self.slot) - len(taken))
+        picked = []
+        for _ in range(k):
+            total = self.total
+            if total <= 0: break
+            i = self._find(random.random() * total)
+            if i is None: break             # only round-off residue left in the tree
+            picked.append(self.ids[i])
+            taken.append((i, self.weights[i]))
+            self._set(i, 0.0)           # exclude from the following picks
+        for i, w in taken:
+            self._set(i, w)
+        if len(picked) < k and fill:
+            # zero-weight peers are still eligible once the weighted ones run out
+            seen = set(picked) | set(exclude)
+            for pid in self.slot:
+                if len(picked) == k: break
+                if pid not in seen: picked.append(pid)
+        return picked
+
+    # ---------- internals ----------
+    def _set(self, i: int, weight: float):
+        weight = max(float(weight), 0.0)
+        delta = weight - self.weights[i]
+        if delta == 0.0: return
+        self.weights[i] = weight
+        j = i + 1
+        while j <= self.size:
+            self.tree[j] += delta
+            j += j & -j
+
+    def _prefix(self, n: int) -> float:
+        s = 0.0
+        while n > 0:
+            s += self.tree[n]
+            n -= n & -n
+        return s
+
+    def _find(self, r: float) -> Optional[int]:
+        # smallest slot whose prefix sum exceeds r (binary descent over the tree)
+        pos, step = 0, self.size
+        while step:
+            nxt = pos + step
+            if nxt <= self.size and self.tree[nxt] <= r:
+                pos = nxt
+                r -= self.tree[nxt]
+            step >>= 1
+        pos = min(pos, self.size - 1)
+        if self.weights[pos] <= 0.0:
+            # float round-off at a boundary: fall back to the nearest weighted slot
+            live = [j for j in range(self.size) if self.weights[j] > 0.0]
+            if not live: return None
+            pos = min(live, key=lambda j: abs(j - pos))
+        return pos
+
+    def _grow(self):
+        n = self.size
+        self.size = n * 2
+        self.weights += [0.0] * n
+        self.ids += [None] * n
+        self.free = list(range(self.size - 1, n - 1, -1)) + self.free
+        # O(n) Fenwick rebuild
+        self.tree = [0.0] + list(self.weights)
+        for j in range(1, self.size + 1):
+            p = j + (j & -j)
+            if p <= self.size: self.tree[p] += self.tree[j]
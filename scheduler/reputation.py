@@ -0,0 +1,60 @@
+"""
+MIT – peer reputation for adaptive replication
+Emmanuel Dessallien 2024
+
+Each peer's reliability is the mean of a Beta posterior over its vote
+history: agreeing with a committed result counts as a success, voting
+against it (or failing a coordinator audit) as `penalty` failures. A set of
+peers returning the same digest is trusted with 1 - Π(1 - score), i.e.
+the chance that at least one of them is honest. The scheduler dispatches
+only as many of the best-scored candidates as reach `confidence`, and
+commits as soon as a digest's supporters reach it. With probability
+`spot_check` a job gets full redundancy and waits for `min_votes` anyway, so
+trusted peers keep being cross-checked and a peer that turns bad loses its
+trust.
+"""
+import random
+from typing import Dict, Iterable, List
+
+class Reputation:
+    def __init__(self, confidence: float = 0.99, spot_check: float = 0.1,
+                 prior=(1.0, 1.0), penalty: float = 10.0):
+        self.confidence = confidence
+        self.spot_check = spot_check
+        self.prior = prior               # Beta(agree, disagree) pseudo-counts for a new peer
+        self.penalty = penalty
+        self.stats: Dict[str, List[float]] = {}
+
+    def score(self, peer_id: str) -> float:
+        a, b = self.stats.get(peer_id) or self.prior
+        return a / (a + b)
+
+    def record(self, peer_id: str, agreed: bool):
+        s = self.stats.setdefault(peer_id, list(self.prior))
+        if agreed: s[0] += 1
+        else: s[1] += self.penalty
+
+    def penalize(self, peer_id: str):
+        """Audit caught the peer: drop all earned trust."""
+        self.stats[peer_id] = [self.prior[0], self.prior[1] + self.penalty]
+
+    def trust(self, peer_ids: Iterable[str]) -> float:
+        doubt = 1.0
+        for p in peer_ids: doubt *= 1.0 - self.score(p)
+        return 1.0 - doubt
+
+    def confident(self, peer_ids: Iterable[str]) -> bool:
+        return self.trust(peer_ids) >= self.confidence
+
+    def spot(self) -> bool:
+        """Draw whether a job is spot-checked: full redundancy and no early commit, so every vote is compared."""
+        return random.random() < self.spot_check
+
+    def plan(self, peers: list) -> list:
+        """Shortest best-first prefix of `peers` (Peer objects) that reaches `confidence`; all of them otherwise."""
+        ranked = sorted(peers, key=lambda p: self.score(p.peer_id), reverse=True)
+        doubt = 1.0
+        for i, p in enumerate(ranked):
+            doubt *= 1.0 - self.score(p.peer_id)
+            if 1.0 - doubt >= self.confidence: return ranked[:i + 1]
+        return peers
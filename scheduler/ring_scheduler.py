@@ -2,10 +2,16 @@
 MIT – private scheduler for Torrent-Tokens
 Emmanuel Dessallien 2024
 """
-import asyncio, json, time, math, random
+import asyncio, json, time, math, random, hashlib
 from dataclasses import dataclass, field
 from typing import Dict, List, Optional, Tuple
 from collections import deque
+from scheduler.peer_sampler import PeerSampler
+from scheduler import wire
+from scheduler.deadlines import DeadlineQueue
+from scheduler.shards import ShardMap
+from telemetry.metrics import NULL
+from telemetry import trace
 
 @dataclass
 class Peer:
@@ -14,66 +20,353 @@ class Peer:
     sram_mb: int
     upload_mbps: float
     watts: float
-    last_ping: float = field(default_factory=time.time)
+    last_ping: float = field(default_factory=time.time)   # last sign of life (loop clock once joined)
+    srtt: Optional[float] = None    # smoothed send→result latency (s)
+    rttvar: float = 0.0
+    rtt: Optional[float] = None     # EWMA of ping round trips (s)
+    compute: Optional[float] = None # EWMA of result latency minus rtt (s)
+    misses: int = 0                 # consecutive tiles that stalled on this peer
+    quarantined_until: float = 0.0
+    inflight: int = 0               # tiles sent and not yet answered / timed out
+    loading_until: float = 0.0      # expected end of a shard load we asked for
 
 @dataclass
 class TileJob:
     tile_id: int
     model_id: int
     act_blob: bytes
+    layer: Optional[int] = None        # weight shard (model_id, layer) the tile needs; None = any peer
     assigned: List[Tuple[str,int]] = field(default_factory=list)
-    results: Dict[str, bytes] = field(default_factory=dict)
+    results: Dict[str, bytes] = field(default_factory=dict)    # peer_id -> result digest
+    payloads: Dict[bytes, bytes] = field(default_factory=dict)  # digest -> first payload seen
+    tally: Dict[bytes, int] = field(default_factory=dict)       # digest -> votes
+    sent_at: Dict[str, float] = field(default_factory=dict)
     committed: Optional[bytes] = None
+    queued_at: float = 0.0
+    act_c128: Optional[bytes] = None   # wire checksum, computed once and reused per replica
+    traced: bool = False               # sampled by the tracer at enqueue
+    requeued_at: float = 0.0           # last stall re-queue
+    spot_check: bool = False           # reputation spot check: full replicas, no early commit
+    dispatches: int = 0                # dispatch rounds so far (first send plus re-dispatches after stalls)
+    step_id: int = 0                   # wire step_id: per-job sequence, so a re-added tile never takes the old job's results
+
+    @property
+    def key(self) -> Tuple[int,int,int]:
+        return (self.model_id, self.tile_id, self.step_id)
+
+    @property
+    def shard(self) -> Optional[Tuple[int,int]]:
+        return None if self.layer is None else (self.model_id, self.layer)
 
 class RingScheduler:
-    def __init__(self, max_stall_ms=150, min_votes=2):
-        self.max_stall = max_stall_ms / 1000.0
+    def __init__(self, max_stall_ms=150, min_stall_ms=20, min_votes=2, replicas=3, window=1,
+                 atol=None, rtol=1e-5, binary=True, audit_rate=0.0, auditor=None,
+                 ping_interval=1.0, dead_after=5.0, max_misses=3, quarantine_s=30.0,
+                 shard_mb=28.0, shard_load_ms=500,
+                 peer_window=2, max_peer_inflight=8, max_queue=10_000, shed_after=None,
+                 batch_ms=0.0, batch_bytes=64 * 1024, metrics=None, tracer=None, ledger=None, reputation=None,
+                 max_dispatches=8):
+        self.max_stall = max_stall_ms / 1000.0   # timeout for peers with no latency history
+        self.min_stall = min_stall_ms / 1000.0
         self.min_votes = min_votes
+        self.atol = atol              # None = byte-exact voting; float = tolerant float32 quorum
+        self.rtol = rtol
+        self.binary = binary          # wire.js ACTV/RESULT frames; False = legacy JSON RUN_TILE
+        self.audit_rate = audit_rate  # fraction of commits recomputed on the coordinator
+        self.auditor = auditor        # job -> expected result bytes (e.g. kernel.matmul_4bit_ref.TileAuditor)
+        self.audits = {"checked": 0, "failed": 0, "errors": 0}
+        self._audit_tasks = set()     # running audits (the loop only keeps weak references)
+        self.strikes: Dict[str, int] = {}
+        self.replicas = replicas
+        self.reputation = reputation  # scheduler.reputation.Reputation: fewer replicas + early commit for trusted peers
+        self.window = window          # max jobs dispatched concurrently
         self.peers: Dict[str, Peer] = {}
-        self.jobs = deque()
+        self.restored: Dict[str, Tuple[Peer, list]] = {}   # peer_id -> (metadata, resident shards) from a snapshot
+        self.jobs = deque()           # pending (not yet dispatched / re-queued)
+        self.inflight: Dict[Tuple[int,int,int], TileJob] = {}
+        self.index: Dict[Tuple[int,int,int], TileJob] = {}   # every live job, pending or in flight
+        self._step = 0                # last step_id handed out (u32, wraps)
         self.credits: Dict[str, float] = {}
+        self.ledger = ledger          # persistent credits, e.g. credit.async_ledger.AsyncLedger (never blocks)
+        self.sampler = PeerSampler()
+        self.deadlines = DeadlineQueue(self._on_stall)
+        self.ping_interval = ping_interval   # heartbeat period (s)
+        self.dead_after = dead_after         # evict peers silent for this long (s)
+        self.max_misses = max_misses         # consecutive stalls before quarantine
+        self.quarantine_s = quarantine_s
+        self.evicted = 0
+        self._heartbeat_task = None
+        self.shards = ShardMap(shard_mb)     # which peer holds which layer's weights
+        self.shard_loads = 0                 # cold loads we caused (warm_shard sent)
+        self.shard_load = shard_load_ms / 1000.0   # expected cold-load time, added to stall timeouts
+        self.peer_window = peer_window               # per-peer in-flight limit before we have measurements
+        self.max_peer_inflight = max_peer_inflight
+        self.max_queue = max_queue                   # pending jobs before add_job blocks (None = unbounded)
+        self.shed_after = shed_after                 # drop jobs still undispatched after this many s
+        self.max_dispatches = max_dispatches         # dispatch rounds without quorum before a job is dropped (None = never)
+        self.rejected = 0
+        self.shed = 0
+        self.abandoned = 0
+        self._space_waiters = deque()                # producers blocked in add_job
+        self.batch_ms = batch_ms                     # coalesce ACTV frames per peer for this long (None = off)
+        self.batch_bytes = batch_bytes               # ... or until this many bytes are queued
+        self._outbox: Dict[str, list] = {}           # peer_id -> [frames, bytes, flush handle]
+        self.tracer = tracer or trace.NULL           # telemetry.trace.Tracer for sampled job spans
+        self.instrument(metrics or NULL)
+
+    def instrument(self, reg):
+        """Bind metrics from a telemetry.metrics.Registry (NULL = disabled)."""
+        self._m_queued = reg.counter("tt_jobs_queued_total", "Tiles accepted by add_job")
+        self._m_dispatched = reg.counter("tt_tiles_dispatched_total", "Tile replicas sent to peers")
+        self._m_committed = reg.counter("tt_jobs_committed_total", "Tiles that reached quorum")
+        self._m_requeued = reg.counter("tt_stall_requeues_total", "Jobs re-queued after a stall timeout")
+        self._m_disagree = reg.counter("tt_vote_disagreements_total", "Results whose digest differs from an earlier vote")
+        self._m_shed = reg.counter("tt_jobs_shed_total", "Jobs dropped undispatched after shed_after")
+        self._m_abandoned = reg.counter("tt_jobs_abandoned_total", "Jobs dropped after max_dispatches rounds without quorum")
+        self._m_rejected = reg.counter("tt_jobs_rejected_total", "add_job calls that timed out on a full queue")
+        self._m_early = reg.counter("tt_early_commits_total", "Commits on peer reputation before min_votes")
+        self._m_cancelled = reg.counter("tt_replicas_cancelled_total", "Outstanding replicas cancelled at commit")
+        self._m_audit_errors = reg.counter("tt_audit_errors_total", "Audits that raised instead of returning a verdict")
+        self._m_evicted = reg.counter("tt_peers_evicted_total", "Peers evicted for missed heartbeats")
+        self._m_dispatch_lat = reg.histogram("tt_dispatch_latency_seconds", "Enqueue to dispatch")
+        self._m_commit_lat = reg.histogram("tt_commit_latency_seconds", "Enqueue to commit")
+        reg.gauge("tt_jobs_queued", "Jobs waiting for dispatch", fn=lambda: len(self.jobs))
+        reg.gauge("tt_jobs_inflight", "Jobs dispatched and awaiting quorum", fn=lambda: len(self.inflight))
+        reg.gauge("tt_peers", "Connected peers", fn=lambda: len(self.peers))
 
     # ---------- public API ----------
-    async def add_job(self, tile_id: int, model_id: int, act_blob: bytes):
-        job = TileJob(tile_id, model_id, act_blob)
+    @property
+    def queue_depth(self) -> int:
+        return len(self.jobs)
+
+    async def add_job(self, tile_id: int, model_id: int, act_blob: bytes, layer: Optional[int] = None,
+                      timeout: Optional[float] = None):
+        """Queue a tile. Blocks while the queue is full; raises asyncio.QueueFull after `timeout` s."""
+        while self.max_queue is not None and len(self.jobs) >= self.max_queue:
+            fut = asyncio.get_running_loop().create_future()
+            self._space_waiters.append(fut)
+            try:
+                await asyncio.wait_for(fut, timeout)
+            except asyncio.TimeoutError:
+                self.rejected += 1
+                self._m_rejected.inc()
+                raise asyncio.QueueFull(f"job queue full ({self.max_queue})")
+        job = TileJob(tile_id, model_id, act_blob, layer, queued_at=self._now(), step_id=self._next_step())
+        self.index[job.key] = job
         self.jobs.append(job)
+        self._m_queued.inc()
+        if self.tracer.sample():
+            job.traced = True
+            self.tracer.instant("enqueue", job, job.queued_at, bytes=len(act_blob), layer=layer)
+        if job.shard is not None: self._prewarm(job.shard)
         await self._schedule()
 
-    async def on_result(self, peer_id: str, tile_id: int, result: bytes):
-        job = self._find_job(tile_id)
-        if not job: return
-        job.results[peer_id] = result
-        await self._try_commit(job)
+    async def on_result(self, peer_id: str, tile_id: int, result: bytes, model_id: Optional[int] = None,
+                        step_id: Optional[int] = None):
+        job = self._find_job(tile_id, model_id, step_id)
+        if not job or peer_id in job.results: return
+        p = self.peers.get(peer_id)
+        sent = job.sent_at.pop(peer_id, None)
+        if sent is not None:
+            self._observe(peer_id, self._now() - sent)
+            if p: self._busy(p, -1)
+        if p: p.last_ping, p.misses = self._now(), 0
+        # vote on our own digest (a peer-supplied checksum could lie); keep one payload per digest
+        digest = hashlib.blake2b(result, digest_size=16).digest()
+        if job.tally and digest not in job.tally: self._m_disagree.inc()
+        if job.traced:
+            args = dict(peer=peer_id, bytes=len(result), agrees=job.tally.get(digest, 0))
+            if sent is None: self.tracer.instant("late_result", job, self._now(), **args)
+            else: self.tracer.replica(job, peer_id, sent, self._now(), **args)
+        job.results[peer_id] = digest
+        job.tally[digest] = job.tally.get(digest, 0) + 1
+        if digest not in job.payloads: job.payloads[digest] = bytes(result)
+        if not await self._try_commit(job, digest):
+            await self._schedule()            # the peer has a free slot again
+
+    async def on_frame(self, peer_id: str, frame):
+        """Binary RESULT (or BATCH of RESULTs) from a peer; session_id carries the model_id."""
+        for f in wire.unbatch(frame):
+            r = wire.dec_result(f)
+            await self.on_result(peer_id, r.tile_id, bytes(r.body), model_id=r.session_id, step_id=r.step_id)
 
     async def on_peer_join(self, peer: Peer):
+        if peer.peer_id in self.peers: await self.on_peer_leave(peer.peer_id)   # reconnect without a leave
         self.peers[peer.peer_id] = peer
+        peer.last_ping = self._now()
+        old, resident = self.restored.pop(peer.peer_id, (None, ()))
+        if old is not None and peer.srtt is None:      # known from before a restart: skip the warm-up
+            peer.srtt, peer.rttvar, peer.rtt, peer.compute = old.srtt, old.rttvar, old.rtt, old.compute
+        self.sampler.add(peer.peer_id, self._weight(peer.peer_id))
+        self.shards.add_peer(peer.peer_id, peer.sram_mb)
+        for shard in resident: self.shards.touch(peer.peer_id, tuple(shard))
+        if self._heartbeat_task is None or self._heartbeat_task.done():
+            self._heartbeat_task = asyncio.get_running_loop().create_task(self._heartbeat())
         await self._schedule()
 
+    async def on_pong(self, peer_id: str, sent: float):
+        """PONG echoing the loop timestamp of our PING."""
+        p = self.peers.get(peer_id)
+        if not p: return
+        now = self._now()
+        p.last_ping = now
+        p.rtt = self._ewma(p.rtt, now - sent)
+        self.sampler.update(peer_id, self._weight(peer_id))
+
+    async def on_peer_leave(self, peer_id: str):
+        self.peers.pop(peer_id, None)
+        # its outstanding replicas are lost; forget them so a stall or late result for them cannot
+        # release a slot on a new Peer that rejoins under the same id (the stall re-dispatches the job)
+        for job in self.inflight.values():
+            job.sent_at.pop(peer_id, None)
+        out = self._outbox.pop(peer_id, None)
+        if out and out[2]: out[2].cancel()
+        self.sampler.remove(peer_id)
+        self.shards.remove_peer(peer_id)
+
+    def update_credit(self, peer_id: str):
+        """Re-weight a peer after its score inputs changed."""
+        if peer_id in self.peers:
+            self.sampler.update(peer_id, self._weight(peer_id))
+
     # ---------- internals ----------
     async def _schedule(self):
-        while self.jobs and len(self.peers) >= 3:
+        # dispatch up to `window` jobs at once; a slow tile no longer blocks the ones behind it
+        while self.jobs and len(self.inflight) < self.window and len(self.peers) >= self.replicas:
             job = self.jobs[0]
-            if len(job.assigned) >= 3: break
-            peers = self._pick_peers(3 - len(job.assigned))
+            if job.committed is not None:            # committed while re-queued
+                self._pop()
+                continue
+            if self.shed_after is not None and self._now() - job.queued_at > self.shed_after:
+                self._pop()
+                self.shed += 1
+                self._m_shed.inc()
+                if job.traced: self.tracer.span("job", job, job.queued_at, self._now(), shed=True)
+                self._retire(job)
+                continue
+            if self.max_dispatches is not None and job.dispatches >= self.max_dispatches:
+                # results that never agree (or peers that never answer) must not hold a window slot forever
+                self._abandon(job)
+                continue
+            # top up to `replicas`; a job whose replicas all answered without quorum still needs new voters
+            need = max(self.replicas - len(job.assigned), self.min_votes - max(job.tally.values(), default=0))
+            t0 = time.perf_counter() if job.traced else 0.0
+            peers = self._pick_peers(need, exclude=[a[0] for a in job.assigned], shard=job.shard)
+            if self.reputation is not None and not job.assigned:
+                job.spot_check = self.reputation.spot()
+                if not job.spot_check: peers = self.reputation.plan(peers)  # trusted peers need fewer replicas
+            if len(peers) < min(need, self.min_votes) and (self.reputation is None or job.spot_check
+                                                            or not self.reputation.confident(p.peer_id for p in peers)):
+                if not peers and len(job.results) >= len(self.peers) and all(pid in job.results for pid in self.peers):
+                    self._abandon(job)               # every peer has voted and still no quorum: none left to ask
+                    continue
+                break                                # every candidate is at its in-flight limit
+            self._pop()
+            self.inflight[job.key] = job
+            job.dispatches += 1
+            now = self._now()
+            self._m_dispatch_lat.observe(now - job.queued_at)
+            if job.traced:
+                self.tracer.span("queued", job, job.requeued_at or job.queued_at, now)
+                self.tracer.span("pick", job, now, now + time.perf_counter() - t0,
+                                 need=need, peers=[p.peer_id for p in peers])
+            self._m_dispatched.inc(len(peers))
             for i, p in enumerate(peers):
                 job.assigned.append((p.peer_id, i))
+                job.sent_at[p.peer_id] = self._now()
+                self._busy(p, +1)
+                cold = job.shard is not None and not self.shards.is_warm(p.peer_id, job.shard)
+                if cold: self._load_shard(p, job.shard)
+                if job.shard is not None: self.shards.touch(p.peer_id, job.shard)
+                if job.traced: self.tracer.instant("send", job, now, peer=p.peer_id, bytes=len(job.act_blob), cold=cold)
                 await self._send_tile(p, job)
-            asyncio.create_task(self._stall_guard(job))
+            self.deadlines.arm(job.key, self._stall_timeout(job))
 
-    def _pick_peers(self, n: int) -> List[Peer]:
-        # credit-weighted random sample
-        total = sum(self._credit(p.peer_id) for p in self.peers.values())
-        if total == 0: return list(self.peers.values())[:n]
+    def _pick_peers(self, n: int, exclude=(), shard=None) -> List[Peer]:
+        # peers already holding the shard first, then a credit-weighted sample of distinct peers
+        # (O(n log P) via the Fenwick sampler) for whatever is left
         picked = []
-        for _ in range(n):
-            r = random.random() * total
-            cum = 0.0
-            for p in self.peers.values():
-                cum += self._credit(p.peer_id)
-                if cum >= r:
-                    picked.append(p)
-                    break
-        return picked
+        if shard is not None:
+            skip = set(exclude)
+            warm = [self.peers[pid] for pid in self.shards.warm(shard) if pid not in skip]
+            free = [p.peer_id for p in warm if self._has_slot(p)]
+            picked = random.sample(free, min(n, len(free)))
+            if len(picked) < n:
+                # warm peers at their limit: queueing behind their tiles still beats a cold shard load,
+                # so only spill to cold peers once that wait would exceed shard_load
+                full = sorted((p for p in warm if not p.quarantined_until and not self._has_slot(p)),
+                              key=self._queue_wait)
+                picked += [p.peer_id for p in full[:n - len(picked)] if self._queue_wait(p) < self.shard_load]
+        if len(picked) < n:
+            # saturated and quarantined peers carry weight 0 and are never filled in
+            picked += self.sampler.sample(n - len(picked), [*exclude, *picked], fill=False)
+        return [self.peers[pid] for pid in picked]
+
+    def _limit(self, p: Peer) -> int:
+        # Little's law: tiles in flight = throughput (1/compute) x turnaround (srtt)
+        if p.srtt is None or not p.compute: return self.peer_window
+        return max(1, min(self.max_peer_inflight, math.ceil(p.srtt / p.compute)))
+
+    def _queue_wait(self, p: Peer) -> float:
+        # expected wait for one more tile on a peer past its limit: its load, then one tile per srtt/limit
+        limit = self._limit(p)
+        per_tile = (p.srtt or self.max_stall) / limit
+        return max(p.loading_until - self._now(), 0.0) + (p.inflight - limit + 1) * per_tile
+
+    def _has_slot(self, p: Peer) -> bool:
+        return not p.quarantined_until and p.inflight < self._limit(p)
+
+    def _busy(self, p: Peer, delta: int):
+        p.inflight += delta
+        self.sampler.update(p.peer_id, self._weight(p.peer_id))
+
+    def _abandon(self, job: TileJob):
+        self._pop()
+        self.abandoned += 1
+        self._m_abandoned.inc()
+        if job.traced: self.tracer.span("job", job, job.queued_at, self._now(), abandoned=True)
+        self._retire(job)
+
+    def _next_step(self) -> int:
+        self._step = (self._step + 1) & 0xFFFFFFFF
+        return self._step
+
+    def _pop(self) -> TileJob:
+        job = self.jobs.popleft()
+        self._wake_producers()               # every pop frees space, whether the job was sent, shed or skipped
+        return job
+
+    def _wake_producers(self):
+        while self._space_waiters and (self.max_queue is None or len(self.jobs) < self.max_queue):
+            fut = self._space_waiters.popleft()
+            if not fut.done():
+                fut.set_result(None)
+                break
+
+    def _prewarm(self, shard: Tuple[int,int]):
+        # demand for a shard held by fewer than `replicas` peers: have idle peers load it now
+        short = self.replicas - len(self.shards.warm(shard))
+        if short <= 0: return
+        for pid in self.sampler.sample(2 * short, self.shards.warm(shard), fill=False):
+            p = self.peers[pid]
+            if p.inflight: continue
+            self._load_shard(p, shard)
+            self.shards.touch(pid, shard)
+            short -= 1
+            if not short: break
+
+    def _load_shard(self, peer: Peer, shard: Tuple[int,int]):
+        self.shard_loads += 1
+        peer.loading_until = max(peer.loading_until, self._now()) + self.shard_load
+        if peer.rtc_conn:   # not worker_hp.js's load_shard, which carries weight urls/heads
+            peer.rtc_conn.send(json.dumps({"type": "warm_shard", "model_id": shard[0], "layer": shard[1]}))
+
+    def _weight(self, peer_id: str) -> float:
+        # selection weight: static score per second of expected turnaround; 0 while quarantined or full
+        p = self.peers.get(peer_id)
+        if not p or not self._has_slot(p): return 0.0
+        latency = p.srtt if p.srtt is not None else self.max_stall
+        return self._credit(peer_id) / max(latency, self.min_stall)
 
     def _credit(self, peer_id: str) -> float:
         p = self.peers.get(peer_id)
@@ -81,36 +374,231 @@ class RingScheduler:
         return p.sram_mb * p.upload_mbps / max(p.watts, 0.1)
 
     async def _send_tile(self, peer: Peer, job: TileJob):
-        msg = {"type": "RUN_TILE", "tile_id": job.tile_id, "act_blob": job.act_blob.hex()}
+        if self.binary:
+            if job.act_c128 is None: job.act_c128 = wire.checksum128(job.act_blob)
+            frame = wire.enc_actv(job.model_id, job.step_id, job.tile_id, job.act_blob, c128=job.act_c128)
+            if not peer.rtc_conn:
+                print(f"[stub] send to {peer.peer_id}: ACTV tile={job.tile_id} model={job.model_id} {len(frame)} B")
+            elif self.batch_ms is None:
+                peer.rtc_conn.send(frame)
+            else:
+                self._enqueue(peer, frame, job.key)
+            return
+        msg = {"type": "RUN_TILE", "tile_id": job.tile_id, "model_id": job.model_id, "step_id": job.step_id,
+               "act_blob": job.act_blob.hex()}
         if peer.rtc_conn:
             peer.rtc_conn.send(json.dumps(msg))
         else:
             print(f"[stub] send to {peer.peer_id}: {msg}")
 
-    async def _stall_guard(self, job: TileJob):
-        await asyncio.sleep(self.max_stall)
-        if job.committed is None:
-            # reschedule to new peers
-            self.jobs.appendleft(job)
-
-    async def _try_commit(self, job: TileJob):
-        checksums = list(job.results.values())
-        if len(checksums) >= self.min_votes:
-            from collections import Counter
-            cnt = Counter(checksums)
-            top = cnt.most_common(1)
-            if top[0][1] >= self.min_votes:
-                job.committed = top[0][0]
-                self._reward(job)
-                self.jobs.popleft()
+    def _enqueue(self, peer: Peer, frame, key: Tuple[int,int,int]):
+        # per-message overhead dominates small tiles: hold frames for a peer until the flush
+        # window closes (0 = end of this scheduling pass) or the byte budget fills
+        out = self._outbox.setdefault(peer.peer_id, [[], 0, None, []])
+        out[0].append(frame)
+        out[1] += len(frame)
+        out[3].append(key)
+        if out[1] >= self.batch_bytes:
+            self._flush(peer.peer_id)
+        elif out[2] is None:
+            loop = asyncio.get_running_loop()
+            out[2] = (loop.call_later(self.batch_ms / 1000.0, self._flush, peer.peer_id) if self.batch_ms
+                      else loop.call_soon(self._flush, peer.peer_id))
+
+    def _flush(self, peer_id: str):
+        out = self._outbox.pop(peer_id, None)
+        p = self.peers.get(peer_id)
+        if not out or not p: return
+        if out[2]: out[2].cancel()
+        frames = out[0]
+        p.rtc_conn.send(frames[0] if len(frames) == 1 else wire.enc_batch(frames))
+
+    def _cancel(self, peer: Peer, job: TileJob):
+        # a replica still in the outbox is simply dropped; one already sent gets a cancel the worker can honour
+        self._m_cancelled.inc()
+        out = self._outbox.get(peer.peer_id)
+        if out and job.key in out[3]:
+            i = out[3].index(job.key)
+            out[1] -= len(out[0].pop(i))
+            out[3].pop(i)
+            if not out[0]:
+                if out[2]: out[2].cancel()
+                del self._outbox[peer.peer_id]
+        elif peer.rtc_conn:
+            peer.rtc_conn.send(json.dumps({"type": "cancel", "model_id": job.model_id, "tile_id": job.tile_id,
+                                           "step_id": job.step_id}))
+
+    @staticmethod
+    def _now() -> float:
+        # event-loop clock (monotonic by default; virtual under scheduler.sim)
+        return asyncio.get_running_loop().time()
+
+    def _observe(self, peer_id: str, sample: float):
+        # Jacobson/Karels smoothing, as TCP does for its retransmit timer
+        p = self.peers.get(peer_id)
+        if not p: return
+        if p.srtt is None:
+            p.srtt, p.rttvar = sample, sample / 2
+        else:
+            p.rttvar = 0.75 * p.rttvar + 0.25 * abs(p.srtt - sample)
+            p.srtt = 0.875 * p.srtt + 0.125 * sample
+        p.compute = self._ewma(p.compute, max(sample - (p.rtt or 0.0), 0.0))
+        self.sampler.update(peer_id, self._weight(peer_id))
+
+    @staticmethod
+    def _ewma(prev: Optional[float], sample: float, alpha: float = 0.2) -> float:
+        return sample if prev is None else (1 - alpha) * prev + alpha * sample
+
+    async def _heartbeat(self):
+        while self.peers:
+            await asyncio.sleep(self.ping_interval)
+            now = self._now()
+            for p in list(self.peers.values()):
+                if p.quarantined_until and now >= p.quarantined_until:
+                    p.quarantined_until, p.misses = 0.0, 0
+                    self.sampler.update(p.peer_id, self._weight(p.peer_id))
+                if not p.rtc_conn: continue          # stub peers have no channel to ping
+                # only peers that have answered a ping can be judged by silence (older workers never pong)
+                if p.rtt is not None and now - p.last_ping > self.dead_after:
+                    self.evicted += 1
+                    self._m_evicted.inc()
+                    await self.on_peer_leave(p.peer_id)
+                    continue
+                p.rtc_conn.send(json.dumps({"type": "ping", "t": now}))
+
+    def _miss(self, peer_id: str):
+        p = self.peers.get(peer_id)
+        if not p: return
+        p.misses += 1
+        if p.misses >= self.max_misses and not p.quarantined_until:
+            p.quarantined_until = self._now() + self.quarantine_s
+            self.sampler.update(peer_id, 0.0)
+
+    def _stall_timeout(self, job: TileJob) -> float:
+        # wait for the slowest still-outstanding replica; unknown peers get max_stall
+        waits, now = [], self._now()
+        for peer_id in job.sent_at:
+            p = self.peers.get(peer_id)
+            if p is None or p.srtt is None: w = self.max_stall
+            else: w = min(max(p.srtt + 4 * p.rttvar, self.min_stall), 4 * self.max_stall)
+            # a peer still fetching weights we told it to load gets that time on top
+            waits.append(w + max(p.loading_until - now, 0.0) if p else w)
+        return max(waits, default=self.max_stall)
+
+    async def _on_stall(self, key: Tuple[int,int,int]):
+        job = self.inflight.get(key)
+        if job is None or job.committed is not None: return
+        # reschedule to new peers; keep replicas that already answered
+        for peer_id in job.sent_at:
+            self._miss(peer_id)
+            if peer_id in self.peers: self._busy(self.peers[peer_id], -1)
+        if job.traced: self.tracer.instant("stall", job, self._now(), outstanding=list(job.sent_at))
+        job.requeued_at = self._now()
+        del self.inflight[key]
+        job.assigned = [a for a in job.assigned if a[0] in job.results]
+        job.sent_at.clear()
+        self.jobs.appendleft(job)
+        self._m_requeued.inc()
+        await self._schedule()
+
+    async def _try_commit(self, job: TileJob, digest: bytes):
+        winner, early = None, False
+        if self.reputation is not None and not job.spot_check and job.tally[digest] < self.min_votes:
+            # enough trust behind this digest already: commit without waiting for min_votes
+            if self.reputation.confident(p for p, d in job.results.items() if d == digest):
+                winner, early = job.payloads[digest], True
+        if winner is None and len(job.results) >= self.min_votes:
+            if self.atol is not None:
+                from scheduler.verify import tolerant_quorum
+                digests = list(job.payloads)
+                winner = tolerant_quorum([job.payloads[d] for d in digests], self.min_votes,
+                                         self.atol, self.rtol, counts=[job.tally[d] for d in digests])
+            else:
+                # only the digest that just gained a vote can have reached quorum: O(1)
+                winner = job.payloads[digest] if job.tally[digest] >= self.min_votes else None
+        if winner is not None:
+            job.committed = winner
+            if self.reputation is not None and len(job.results) > 1: self._rate(job)
+            job.payloads.clear()
+            self._m_committed.inc()
+            if early: self._m_early.inc()
+            self._m_commit_lat.observe(self._now() - job.queued_at)
+            if job.traced:
+                now = self._now()
+                self.tracer.instant("quorum", job, now, votes=len(job.results), distinct=len(job.tally), early=early)
+                self.tracer.span("job", job, job.queued_at, now, bytes=len(winner))
+            self._reward(job)
+            self._retire(job)
+            if self.auditor and random.random() < self.audit_rate:
+                task = asyncio.get_running_loop().create_task(self._audit(job), name=f"audit {job.model_id}/{job.tile_id}")
+                self._audit_tasks.add(task)
+                task.add_done_callback(self._audit_done)
+            await self._schedule()
+            return True
+        return False
+
+    async def _audit(self, job: TileJob):
+        expected = await asyncio.get_running_loop().run_in_executor(None, self.auditor, job)
+        if expected is None: return
+        self.audits["checked"] += 1
+        from scheduler.verify import tolerant_quorum
+        if tolerant_quorum([expected, job.committed], 2, self.atol or 1e-4, self.rtol) is not None: return
+        # the quorum agreed on a wrong answer: claw back what those peers earned
+        self.audits["failed"] += 1
+        bad = hashlib.blake2b(job.committed, digest_size=16).digest()
+        for peer_id, digest in job.results.items():
+            if digest == bad:
+                self.strikes[peer_id] = self.strikes.get(peer_id, 0) + 1
+                if self.reputation is not None: self.reputation.penalize(peer_id)
+                self._pay(peer_id, -self._credit(peer_id))
+
+    def _audit_done(self, task: asyncio.Task):
+        self._audit_tasks.discard(task)
+        if task.cancelled() or task.exception() is None: return
+        e = task.exception()
+        self.audits["errors"] += 1
+        self._m_audit_errors.inc()
+        print(f"[{task.get_name()}] failed: {type(e).__name__}: {e}")
+
+    def _retire(self, job: TileJob):
+        # O(1) removal by key; a copy left in the pending queue is skipped lazily by _schedule
+        if self.index.get(job.key) is job: del self.index[job.key]
+        if self.inflight.get(job.key) is job: del self.inflight[job.key]
+        self.deadlines.cancel(job.key)
+        for peer_id in job.sent_at:           # replicas still outstanding are released (and cancelled) now
+            p = self.peers.get(peer_id)
+            if p is None: continue
+            self._busy(p, -1)
+            if job.committed is not None: self._cancel(p, job)
+        job.sent_at.clear()
+
+    def _rate(self, job: TileJob):
+        # every vote on a committed job is evidence for or against its peer
+        win = hashlib.blake2b(job.committed, digest_size=16).digest()
+        agrees = {win: True}
+        if self.atol is not None:
+            from scheduler.verify import tolerant_quorum
+            for d, blob in job.payloads.items():
+                if d not in agrees:
+                    agrees[d] = tolerant_quorum([job.committed, blob], 2, self.atol, self.rtol) is not None
+        for peer_id, d in job.results.items():
+            self.reputation.record(peer_id, agrees.get(d, False))
 
     def _reward(self, job: TileJob):
         for peer_id, _ in job.assigned:
             if peer_id in job.results:
-                self.credits[peer_id] = self.credits.get(peer_id, 0) + self._credit(peer_id)
+                self._pay(peer_id, self._credit(peer_id))
+
+    def _pay(self, peer_id: str, amount: float):
+        self.credits[peer_id] = self.credits.get(peer_id, 0) + amount
+        if self.ledger is not None: self.ledger.add(peer_id, amount)
 
-    def _find_job(self, tile_id: int) -> Optional[TileJob]:
-        for j in self.jobs:
-            if j.tile_id == tile_id:
-                return j
-        return None
\ No newline at end of file
+    def _find_job(self, tile_id: int, model_id: Optional[int] = None, step_id: Optional[int] = None) -> Optional[TileJob]:
+        if model_id is not None and step_id is not None:
+            return self.index.get((model_id, tile_id, step_id))
+        # legacy callers without the wire ids: scan the (window-bounded) in-flight table first
+        for jobs in (self.inflight.values(), self.index.values()):
+            for j in jobs:
+                if j.tile_id == tile_id and model_id in (None, j.model_id):
+                    return j
+        return None
@@ -0,0 +1,324 @@
+"""
+MIT – sharded multi-process RingScheduler
+Emmanuel Dessallien 2024
+
+One RingScheduler per worker process. A front ShardRouter in the main process
+owns the peers' data channels and fans traffic out:
+
+  jobs     -> shard of their model_id/session (consistent hash ring)
+  peers    -> shard of their peer_id (consistent hash ring); results, pongs
+              and joins/leaves follow the peer
+  frames   <- shards hand outgoing frames back to the router to send
+  credits  <- shards aggregate rewards and report them to the router's ledger
+
+Each shard schedules its own jobs on its own peers, so no cross-shard state is
+needed. Peer churn only touches the churned peer; if a shard drops below
+`min_peers` the router moves peers to it from the fullest shard.
+
+    python -m scheduler.sharded --shards 4 --peers 64 --jobs 4000
+"""
+import argparse, asyncio, bisect, hashlib, json, multiprocessing as mp, threading, time
+from typing import Dict, List, Optional
+from scheduler.ring_scheduler import RingScheduler, Peer
+from scheduler import wire
+from telemetry.metrics import Registry
+
+class HashRing:
+    """Consistent hashing with virtual nodes: adding/removing a node moves ~1/N of the keys."""
+    def __init__(self, nodes=(), vnodes: int = 64):
+        self.vnodes = vnodes
+        self._keys: List[int] = []
+        self._nodes: List = []
+        for n in nodes: self.add(n)
+
+    @staticmethod
+    def _h(key) -> int:
+        return int.from_bytes(hashlib.blake2b(str(key).encode(), digest_size=8).digest(), "big")
+
+    def add(self, node):
+        for v in range(self.vnodes):
+            h = self._h(f"{node}#{v}")
+            i = bisect.bisect(self._keys, h)
+            self._keys.insert(i, h)
+            self._nodes.insert(i, node)
+
+    def remove(self, node):
+        keep = [(k, n) for k, n in zip(self._keys, self._nodes) if n != node]
+        self._keys, self._nodes = [k for k, _ in keep], [n for _, n in keep]
+
+    def node_for(self, key):
+        if not self._keys: raise LookupError("empty hash ring")
+        return self._nodes[bisect.bisect(self._keys, self._h(key)) % len(self._keys)]
+
+# ---------- shard process ----------
+class _ShardConn:
+    """Stands in for a peer's data channel inside a shard: frames go back to the router."""
+    def __init__(self, peer_id: str, out):
+        self.peer_id, self.out = peer_id, out
+
+    def send(self, frame):
+        self.out.put(("send", self.peer_id, frame))
+
+class _CreditProxy:
+    """Ledger stand-in: sums rewards per peer, reported to the router every `interval` s."""
+    def __init__(self, out, interval: float):
+        self.out, self.interval = out, interval
+        self.pending: Dict[str, float] = {}
+
+    def add(self, peer_id: str, credits: float):
+        self.pending[peer_id] = self.pending.get(peer_id, 0.0) + credits
+
+    def report(self):
+        if self.pending:
+            self.out.put(("credit", self.pending))
+            self.pending = {}
+
+    async def run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            self.report()
+
+def _shard_main(idx: int, inq, out, sched_kw: Dict, credit_interval: float):
+    asyncio.run(_shard_loop(idx, inq, out, sched_kw, credit_interval))
+
+def _feed(inq, loop, msgs: asyncio.Queue):
+    for m in iter(inq.get, None):
+        loop.call_soon_threadsafe(msgs.put_nowait, m)
+    loop.call_soon_threadsafe(msgs.put_nowait, None)
+
+async def _feed_jobs(idx: int, sched: RingScheduler, jobs: asyncio.Queue, out):
+    while True:
+        await sched.add_job(*await jobs.get())
+        out.put(("ack", idx))               # the job is in the scheduler's bounded queue: the router may send another
+
+async def _shard_loop(idx, inq, out, sched_kw, credit_interval):
+    loop = asyncio.get_running_loop()
+    credits = _CreditProxy(out, credit_interval)
+    metrics = Registry()
+    committed = metrics.counter("tt_jobs_committed_total")
+    sched = RingScheduler(ledger=credits, metrics=metrics, **sched_kw)
+    msgs = asyncio.Queue()
+    # mp.Queue.get blocks: a reader thread feeds the loop
+    threading.Thread(target=_feed, args=(inq, loop, msgs), name=f"shard-{idx}-in", daemon=True).start()
+    reporter = loop.create_task(credits.run())
+    # add_job blocks while the shard's queue is full; it runs in its own task so the results
+    # that free space keep being handled (jobs still enter the scheduler in arrival order).
+    # The router holds back once `max_pending` jobs are unacked, which bounds this buffer.
+    jobs = asyncio.Queue()
+    feeder = loop.create_task(_feed_jobs(idx, sched, jobs, out))
+    while (m := await msgs.get()) is not None:
+        kind = m[0]
+        if kind == "job":
+            jobs.put_nowait(m[1:])
+        elif kind == "frame":
+            await sched.on_frame(m[1], m[2])
+        elif kind == "result":
+            await sched.on_result(*m[1:])
+        elif kind == "pong":
+            await sched.on_pong(m[1], m[2])
+        elif kind == "join":
+            _, peer_id, remote, sram_mb, upload_mbps, watts = m
+            await sched.on_peer_join(Peer(peer_id, _ShardConn(peer_id, out) if remote else None,
+                                          sram_mb=sram_mb, upload_mbps=upload_mbps, watts=watts))
+        elif kind == "leave":
+            await sched.on_peer_leave(m[1])
+        elif kind == "stats":
+            out.put(("stats", idx, {"queued": len(sched.jobs) + jobs.qsize(), "inflight": len(sched.inflight),
+                                    "peers": len(sched.peers), "committed": int(committed.value)}))
+    feeder.cancel()
+    reporter.cancel()
+    credits.report()
+    sched.deadlines.stop()
+    out.put(("stopped", idx))
+
+# ---------- front router ----------
+class ShardRouter:
+    def __init__(self, shards: int = 4, ledger=None, min_peers: Optional[int] = None,
+                 credit_interval: float = 0.25, max_pending: int = 256, **sched_kw):
+        self.n = shards
+        self.ledger = ledger                    # receives every shard's credits (e.g. AsyncLedger)
+        self.sched_kw = sched_kw
+        self.min_peers = min_peers if min_peers is not None else sched_kw.get("replicas", 3)
+        self.credit_interval = credit_interval
+        self.max_pending = max_pending          # jobs per shard sent but not yet in its scheduler's queue
+        self._slots: List[asyncio.Semaphore] = []
+        self.rejected = 0
+        self.ring = HashRing(range(shards))
+        self.peers: Dict[str, Peer] = {}
+        self.home: Dict[str, int] = {}          # peer_id -> shard currently scheduling it
+        self.credits: Dict[str, float] = {}
+        self.moved = 0
+        self._procs, self._inqs = [], []
+        self._out = None
+        self._stats: Dict[int, asyncio.Future] = {}
+        self._stopped = None
+
+    async def start(self):
+        ctx = mp.get_context("spawn")
+        self._out = ctx.Queue()
+        for i in range(self.n):
+            q = ctx.Queue()
+            p = ctx.Process(target=_shard_main, args=(i, q, self._out, self.sched_kw, self.credit_interval),
+                            name=f"shard-{i}", daemon=True)
+            p.start()
+            self._procs.append(p)
+            self._inqs.append(q)
+        loop = asyncio.get_running_loop()
+        self._slots = [asyncio.Semaphore(self.max_pending) for _ in range(self.n)]
+        self._stopped = asyncio.Semaphore(0)
+        threading.Thread(target=self._pump, args=(loop,), name="shard-pump", daemon=True).start()
+        for peer in self.peers.values(): self._place(peer)   # peers that joined before start()
+
+    async def stop(self):
+        for q in self._inqs: q.put(None)
+        for _ in range(self.n): await self._stopped.acquire()
+        self._out.put(None)
+        for p in self._procs: p.join()
+
+    # ---------- RingScheduler-shaped API ----------
+    def shard_of_model(self, model_id: int) -> int:
+        return self.ring.node_for(f"model:{model_id}")
+
+    async def add_job(self, tile_id: int, model_id: int, act_blob: bytes, layer: Optional[int] = None,
+                      timeout: Optional[float] = None):
+        """Forward a tile to its shard. Blocks while `max_pending` of that shard's jobs are unacked
+        (acks come once a job is in the shard's own bounded queue); raises asyncio.QueueFull after `timeout` s."""
+        shard = self.shard_of_model(model_id)
+        try:
+            await asyncio.wait_for(self._slots[shard].acquire(), timeout)
+        except asyncio.TimeoutError:
+            self.rejected += 1
+            raise asyncio.QueueFull(f"shard {shard} backlog full ({self.max_pending})")
+        self._inqs[shard].put(("job", tile_id, model_id, bytes(act_blob), layer))
+
+    async def on_frame(self, peer_id: str, frame):
+        if peer_id in self.home: self._inqs[self.home[peer_id]].put(("frame", peer_id, bytes(frame)))
+
+    async def on_result(self, peer_id: str, tile_id: int, result: bytes, model_id: Optional[int] = None,
+                        step_id: Optional[int] = None):
+        if peer_id in self.home:
+            self._inqs[self.home[peer_id]].put(("result", peer_id, tile_id, bytes(result), model_id, step_id))
+
+    async def on_pong(self, peer_id: str, sent: float):
+        if peer_id in self.home: self._inqs[self.home[peer_id]].put(("pong", peer_id, sent))
+
+    async def on_peer_join(self, peer: Peer):
+        self.peers[peer.peer_id] = peer
+        if self._inqs: self._place(peer)
+
+    async def on_peer_leave(self, peer_id: str):
+        self.peers.pop(peer_id, None)
+        shard = self.home.pop(peer_id, None)
+        if shard is not None:
+            self._inqs[shard].put(("leave", peer_id))
+            self._rebalance(shard)
+
+    async def stats(self) -> Dict[int, Dict]:
+        loop = asyncio.get_running_loop()
+        self._stats = {i: loop.create_future() for i in range(self.n)}
+        for q in self._inqs: q.put(("stats",))
+        return {i: await f for i, f in self._stats.items()}
+
+    # ---------- internals ----------
+    def _counts(self) -> List[int]:
+        counts = [0] * self.n
+        for s in self.home.values(): counts[s] += 1
+        return counts
+
+    def _place(self, peer: Peer):
+        # the ring only balances on average: a shard below min_peers (its scheduler cannot dispatch
+        # with fewer than `replicas` peers) gets the newcomer, otherwise the peer goes where it hashes
+        counts = self._counts()
+        short = min(range(self.n), key=counts.__getitem__)
+        self._assign(peer, short if counts[short] < self.min_peers else self.ring.node_for(f"peer:{peer.peer_id}"))
+
+    def _assign(self, peer: Peer, shard: int):
+        self.home[peer.peer_id] = shard
+        self._inqs[shard].put(("join", peer.peer_id, peer.rtc_conn is not None,
+                               peer.sram_mb, peer.upload_mbps, peer.watts))
+
+    def _rebalance(self, shard: int):
+        # a shard that churned below min_peers borrows from the fullest
+        counts = self._counts()
+        while counts[shard] < self.min_peers:
+            donor = max(range(self.n), key=counts.__getitem__)
+            if counts[donor] <= self.min_peers: break
+            peer_id = next(p for p, s in self.home.items() if s == donor)
+            self._inqs[donor].put(("leave", peer_id))
+            self._assign(self.peers[peer_id], shard)
+            counts[donor] -= 1
+            counts[shard] += 1
+            self.moved += 1
+
+    def _pump(self, loop):
+        for m in iter(self._out.get, None):
+            loop.call_soon_threadsafe(self._handle, m)
+
+    def _handle(self, m):
+        kind = m[0]
+        if kind == "send":
+            p = self.peers.get(m[1])
+            if p and p.rtc_conn: p.rtc_conn.send(m[2])
+        elif kind == "ack":
+            self._slots[m[1]].release()
+        elif kind == "credit":
+            for peer_id, d in m[1].items():
+                self.credits[peer_id] = self.credits.get(peer_id, 0.0) + d
+                if self.ledger is not None: self.ledger.add(peer_id, d)
+        elif kind == "stats":
+            f = self._stats.get(m[1])
+            if f and not f.done(): f.set_result(m[2])
+        elif kind == "stopped":
+            self._stopped.release()
+
+# ---------- loopback benchmark ----------
+class _LoopbackConn:
+    """In-process peer: answers pings and ACTV/BATCH frames straight away."""
+    def __init__(self, router: ShardRouter, peer_id: str, result_bytes: int):
+        self.router, self.peer_id, self.result_bytes = router, peer_id, result_bytes
+
+    def send(self, frame):
+        loop = asyncio.get_running_loop()
+        if isinstance(frame, str):
+            msg = json.loads(frame)
+            if msg.get("type") == "ping": loop.create_task(self.router.on_pong(self.peer_id, msg["t"]))
+            return
+        outs = []
+        for f in wire.unbatch(frame):
+            a = wire.dec_actv(f)
+            body = hashlib.shake_128(bytes(a.body)).digest(self.result_bytes)
+            outs.append(wire.enc_result(a.session_id, a.step_id, a.tile_id, body, c128=bytes(16)))
+        reply = outs[0] if len(outs) == 1 else wire.enc_batch(outs)
+        loop.create_task(self.router.on_frame(self.peer_id, reply))
+
+async def _bench(shards: int, peers: int, jobs: int, models: int, act_bytes: int) -> float:
+    router = ShardRouter(shards, window=256, max_queue=512)
+    await router.start()
+    for i in range(peers):
+        await router.on_peer_join(Peer(f"lb-{i}", _LoopbackConn(router, f"lb-{i}", act_bytes),
+                                       sram_mb=64, upload_mbps=50, watts=5))
+    act = bytes(range(256)) * (act_bytes // 256)
+    t = time.perf_counter()
+    for i in range(jobs): await router.add_job(i, i % models, act)
+    while True:
+        await asyncio.sleep(0.05)
+        st = await router.stats()
+        if sum(s["committed"] for s in st.values()) >= jobs: break
+    dt = time.perf_counter() - t
+    await router.stop()
+    return jobs / dt
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--shards", type=int, default=4)
+    ap.add_argument("--peers", type=int, default=64)
+    ap.add_argument("--jobs", type=int, default=4000)
+    ap.add_argument("--models", type=int, default=64, help="distinct model_id/sessions to spread over shards")
+    ap.add_argument("--act-bytes", type=int, default=3072)
+    args = ap.parse_args()
+    for n in sorted({1, args.shards}):
+        rate = asyncio.run(_bench(n, args.peers, args.jobs, args.models, args.act_bytes))
+        print(f"{n} shard(s): {rate:,.0f} jobs/s")
+
+if __name__ == "__main__":
+    main()
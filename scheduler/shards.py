@@ -0,0 +1,53 @@
+"""
+MIT – per-peer resident weight shards for affinity routing
+Emmanuel Dessallien 2024
+
+A shard is one (model_id, layer) weight set (~28 MB per manifest_layerN).
+Each peer holds at most sram_mb // shard_mb shards, evicted LRU; the
+reverse map answers "who is warm for this shard" in O(1).
+"""
+from collections import OrderedDict
+from typing import Dict, Hashable, Optional, Set
+
+class ShardMap:
+    def __init__(self, shard_mb: float = 28.0):
+        self.shard_mb = shard_mb
+        self.resident: Dict[str, OrderedDict] = {}   # peer_id -> shards, least recently used first
+        self.capacity: Dict[str, int] = {}
+        self.holders: Dict[Hashable, Set[str]] = {}
+
+    def add_peer(self, peer_id: str, sram_mb: float):
+        self.resident.setdefault(peer_id, OrderedDict())
+        self.capacity[peer_id] = max(1, int(sram_mb // self.shard_mb))
+
+    def remove_peer(self, peer_id: str):
+        for shard in self.resident.pop(peer_id, ()):
+            self._drop(shard, peer_id)
+        self.capacity.pop(peer_id, None)
+
+    def is_warm(self, peer_id: str, shard: Hashable) -> bool:
+        return shard in self.resident.get(peer_id, ())
+
+    def warm(self, shard: Hashable) -> Set[str]:
+        return self.holders.get(shard, set())
+
+    def touch(self, peer_id: str, shard: Hashable) -> Optional[Hashable]:
+        """Mark `shard` as most recently used on `peer_id`; returns the shard it evicted, if any."""
+        lru = self.resident.get(peer_id)
+        if lru is None: return None
+        if shard in lru:
+            lru.move_to_end(shard)
+            return None
+        lru[shard] = None
+        self.holders.setdefault(shard, set()).add(peer_id)
+        if len(lru) > self.capacity[peer_id]:
+            old, _ = lru.popitem(last=False)
+            self._drop(old, peer_id)
+            return old
+        return None
+
+    def _drop(self, shard: Hashable, peer_id: str):
+        h = self.holders.get(shard)
+        if h is None: return
+        h.discard(peer_id)
+        if not h: del self.holders[shard]
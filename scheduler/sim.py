@@ -0,0 +1,314 @@
+"""
+MIT – discrete-event swarm simulator / benchmark for RingScheduler
+Emmanuel Dessallien 2024
+
+Drives the real scheduler in virtual time: the asyncio loop's clock jumps
+straight to the next timer instead of sleeping, so thousands of mock peers
+and seconds of swarm time run in a fraction of wall time. Peers model
+upload bandwidth, log-normal compute latency, dropouts, churn and
+Byzantine (random) results.
+
+    python -m scheduler.sim                              # all scenarios vs bench/baseline.json
+    python -m scheduler.sim --scenario churn --jobs 5000
+    python -m scheduler.sim --save-baseline              # record a new baseline
+"""
+import argparse, asyncio, hashlib, json, random, selectors, time
+from collections import OrderedDict
+from dataclasses import dataclass, replace
+from pathlib import Path
+from typing import Dict, List
+from scheduler.ring_scheduler import RingScheduler, Peer
+from scheduler import wire
+
+BASELINE = Path(__file__).resolve().parent.parent / "bench" / "baseline.json"
+
+# ---------- virtual time ----------
+class _InstantSelector(selectors.SelectSelector):
+    """Polls real fds (self-pipe, executors) without blocking and advances the virtual clock."""
+    loop = None
+
+    def select(self, timeout=None):
+        ready = super().select(0)
+        if not ready and timeout:
+            self.loop.vt += timeout
+        return ready
+
+class VirtualTimeLoop(asyncio.SelectorEventLoop):
+    def __init__(self):
+        sel = _InstantSelector()
+        super().__init__(sel)
+        sel.loop = self
+        self.vt = 0.0
+
+    def time(self):
+        return self.vt
+
+# ---------- swarm model ----------
+@dataclass
+class Scenario:
+    name: str = "steady"
+    peers: int = 2000
+    jobs: int = 2000
+    arrival_rate: float = 1000.0     # offered jobs/s (Poisson)
+    act_bytes: int = 3072            # one 768-wide f32 activation
+    result_bytes: int = 3072
+    upload_mbps: tuple = (5.0, 100.0)
+    compute_ms: float = 20.0         # log-normal median
+    compute_sigma: float = 0.6
+    rtt_ms: float = 40.0
+    dropout: float = 0.01            # per tile, silently lost
+    byzantine: float = 0.0           # fraction of peers returning garbage
+    churn_per_s: float = 0.0         # peer leave (+ replacement join) events per second
+    layers: int = 0                  # >0: job i needs shard (0, i % layers); cold peers load it first
+    shard_load_ms: float = 500.0     # time to fetch one layer's weights
+    window: int = 256
+    max_stall_ms: float = 150.0
+    seed: int = 0
+
+SCENARIOS = {
+    "steady": Scenario(),
+    "churn": Scenario(name="churn", churn_per_s=50.0, dropout=0.03),
+    "byzantine": Scenario(name="byzantine", byzantine=0.1),
+    "shards": Scenario(name="shards", layers=12),
+}
+
+@dataclass
+class Stats:
+    enqueued: Dict = None
+    commit_lat: List = None
+    sent: int = 0                    # tiles sent to peers
+    msgs: int = 0                    # data-channel messages carrying them (both directions)
+    cold_loads: int = 0
+    useful: int = 0
+    cpu: float = 0.0
+    first: float = None
+    last: float = 0.0
+
+    def __post_init__(self):
+        self.enqueued, self.commit_lat = {}, []
+
+class SimConn:
+    """Stands in for a peer's data channel: answers ACTV frames after a modelled delay."""
+    def __init__(self, sim, peer_id, upload_mbps, compute_s, byzantine, shard_cap):
+        self.sim, self.peer_id = sim, peer_id
+        self.upload_mbps, self.compute_s, self.byzantine = upload_mbps, compute_s, byzantine
+        self.alive = True
+        self.shards = OrderedDict()      # shard -> time its weights are loaded, LRU order
+        self.shard_cap = shard_cap
+        self.replies = {}                # (session_id, tile_id, step_id) -> pending reply, dropped on cancel
+
+    def _load(self, shard) -> float:
+        """Time at which `shard` is usable, starting a load if it is not resident."""
+        now = asyncio.get_running_loop().time()
+        if shard in self.shards:
+            self.shards.move_to_end(shard)
+            return self.shards[shard]
+        self.sim.stats.cold_loads += 1
+        self.shards[shard] = now + self.sim.sc.shard_load_ms / 1000
+        if len(self.shards) > self.shard_cap: self.shards.popitem(last=False)
+        return self.shards[shard]
+
+    def send(self, frame):
+        sim = self.sim
+        if isinstance(frame, str):                   # JSON control message: answer pings
+            msg = json.loads(frame)
+            if self.alive and msg.get("type") == "ping":
+                asyncio.get_running_loop().call_later(sim.sc.rtt_ms / 1000, self._pong, msg["t"])
+            elif msg.get("type") == "warm_shard":
+                self._load((msg["model_id"], msg["layer"]))
+            elif msg.get("type") == "cancel":
+                sim.stats.msgs += 1
+                h = self.replies.pop((msg["model_id"], msg["tile_id"], msg["step_id"]), None)
+                if h: h.cancel()
+            return
+        sim.stats.msgs += 1
+        frames = wire.unbatch(frame)
+        answers = [r for r in map(self._answer, frames) if r]
+        if not answers: return
+        sim.stats.msgs += 1
+        loop = asyncio.get_running_loop()
+        if wire.msg_type(frame) != wire.MT_BATCH:
+            delay, key, out = answers[0]
+            self.replies[key] = loop.call_later(delay, self._deliver, out, key)
+            return
+        # a batch is answered in one message once its slowest tile is done
+        delay = max(d for d, _, _ in answers)
+        loop.call_later(delay, self._deliver, wire.enc_batch([out for _, _, out in answers]))
+
+    def _answer(self, frame):
+        """(delay, tile key, RESULT frame) for one ACTV, or None if the tile is lost."""
+        sim = self.sim
+        sim.stats.sent += 1
+        if not self.alive or sim.rng.random() < sim.sc.dropout: return None
+        a = wire.dec_actv(frame)
+        if self.byzantine:
+            body = sim.rng.randbytes(sim.sc.result_bytes)
+        else:
+            body = hashlib.shake_128(a.tile_id.to_bytes(4, "big") + bytes(a.body)).digest(sim.sc.result_bytes)
+        now = asyncio.get_running_loop().time()
+        wait = max(self._load((a.session_id, a.tile_id % sim.sc.layers)) - now, 0.0) if sim.sc.layers else 0.0
+        delay = (sim.sc.rtt_ms / 1000 + wait
+                 + self.compute_s * sim.rng.lognormvariate(0, sim.sc.compute_sigma)
+                 + len(body) * 8 / (self.upload_mbps * 1e6))
+        return delay, (a.session_id, a.tile_id, a.step_id), wire.enc_result(a.session_id, a.step_id, a.tile_id, body, c128=bytes(16))
+
+    def _pong(self, t):
+        if self.alive:
+            asyncio.get_running_loop().create_task(self.sim.sched.on_pong(self.peer_id, t))
+
+    def _deliver(self, frame, key=None):
+        self.replies.pop(key, None)
+        if self.alive:
+            asyncio.get_running_loop().create_task(self.sim.sched.on_frame(self.peer_id, frame))
+
+class SimScheduler(RingScheduler):
+    """RingScheduler that records commit latency, useful votes and its own CPU time."""
+    def __init__(self, stats: Stats, **kw):
+        super().__init__(**kw)
+        self.stats = stats
+
+    async def _timed(self, coro):
+        t = time.perf_counter()
+        await coro
+        self.stats.cpu += time.perf_counter() - t
+
+    async def add_job(self, tile_id, model_id, act_blob, layer=None, timeout=None):
+        self.stats.enqueued[(model_id, tile_id)] = self._now()
+        await self._timed(super().add_job(tile_id, model_id, act_blob, layer, timeout))
+
+    async def on_frame(self, peer_id, frame):
+        await self._timed(super().on_frame(peer_id, frame))
+
+    async def on_peer_join(self, peer):
+        await self._timed(super().on_peer_join(peer))
+
+    async def on_peer_leave(self, peer_id):
+        await self._timed(super().on_peer_leave(peer_id))
+
+    async def _on_stall(self, key):
+        await self._timed(super()._on_stall(key))
+
+    def _retire(self, job):
+        super()._retire(job)
+        if job.committed is None: return
+        now, st = self._now(), self.stats
+        st.commit_lat.append(now - st.enqueued.pop((job.model_id, job.tile_id)))
+        st.last = now
+        st.useful += job.tally.get(hashlib.blake2b(job.committed, digest_size=16).digest(), 0)
+
+class Swarm:
+    def __init__(self, sc: Scenario, **sched_kw):
+        self.sc = sc
+        self.rng = random.Random(sc.seed)
+        random.seed(sc.seed)              # PeerSampler draws from the global RNG
+        self.stats = Stats()
+        self.sched = SimScheduler(self.stats, window=sc.window, max_stall_ms=sc.max_stall_ms, **sched_kw)
+        self.conns: Dict[str, SimConn] = {}
+        self.next_id = 0
+
+    async def join(self):
+        sc, rng = self.sc, self.rng
+        pid = f"sim-{self.next_id}"
+        self.next_id += 1
+        up = rng.uniform(*sc.upload_mbps)
+        sram = rng.choice((32, 64, 128))
+        conn = SimConn(self, pid, up, sc.compute_ms / 1000, rng.random() < sc.byzantine,
+                       max(1, int(sram // self.sched.shards.shard_mb)))
+        self.conns[pid] = conn
+        await self.sched.on_peer_join(Peer(pid, conn, sram_mb=sram, upload_mbps=up, watts=rng.uniform(3, 15)))
+
+    async def churn(self):
+        while True:
+            await asyncio.sleep(self.rng.expovariate(self.sc.churn_per_s))
+            pid = self.rng.choice(list(self.conns))
+            self.conns.pop(pid).alive = False
+            await self.sched.on_peer_leave(pid)
+            await self.join()
+
+    async def run(self) -> Dict:
+        sc, st = self.sc, self.stats
+        for _ in range(sc.peers):
+            await self.join()
+        churn = asyncio.get_running_loop().create_task(self.churn()) if sc.churn_per_s else None
+        act = self.rng.randbytes(sc.act_bytes)
+        start = self.sched._now()
+        st.first = start
+        for i in range(sc.jobs):
+            await asyncio.sleep(self.rng.expovariate(sc.arrival_rate))
+            await self.sched.add_job(i, 0, act, i % sc.layers if sc.layers else None)
+        limit = self.sched._now() + 60.0
+        while len(st.commit_lat) < sc.jobs and self.sched._now() < limit:
+            await asyncio.sleep(0.05)
+        if churn: churn.cancel()
+        self.sched.deadlines.stop()
+        return self.report()
+
+    def report(self) -> Dict:
+        st, n = self.stats, len(self.stats.commit_lat)
+        lat = sorted(st.commit_lat)
+        pct = lambda p: 1000 * lat[min(len(lat) - 1, int(p * len(lat)))] if lat else float("nan")
+        span = max(st.last - st.first, 1e-9)
+        return {
+            "scenario": self.sc.name,
+            "committed": n,
+            "jobs": self.sc.jobs,
+            "jobs_per_s": round(n / span, 1),
+            "p50_ms": round(pct(0.50), 2),
+            "p99_ms": round(pct(0.99), 2),
+            "wasted_pct": round(100 * (st.sent - st.useful) / max(st.sent, 1), 2),
+            "cold_loads": st.cold_loads,
+            "msgs_per_job": round(st.msgs / max(n, 1), 2),
+            "sched_cpu_us_per_job": round(1e6 * st.cpu / max(n, 1), 1),
+        }
+
+def simulate(sc: Scenario, **sched_kw) -> Dict:
+    loop = VirtualTimeLoop()
+    try:
+        return loop.run_until_complete(Swarm(sc, **sched_kw).run())
+    finally:
+        pending = asyncio.all_tasks(loop)
+        for t in pending: t.cancel()
+        if pending: loop.run_until_complete(asyncio.wait(pending))
+        loop.close()
+
+# ---------- CLI ----------
+LOWER_IS_BETTER = {"p50_ms", "p99_ms", "wasted_pct", "cold_loads", "msgs_per_job", "sched_cpu_us_per_job"}
+
+def compare(result: Dict, base: Dict):
+    for k, v in result.items():
+        if k in ("scenario", "jobs") or k not in base: continue
+        b = base[k]
+        delta = (v - b) / b * 100 if b else 0.0
+        better = (delta < 0) == (k in LOWER_IS_BETTER) or delta == 0
+        print(f"  {k:<22}{v:>12}   base {b:>10}   {delta:+7.1f}% {'✅' if better else '⚠️'}")
+
+def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--scenario", choices=list(SCENARIOS) + ["all"], default="all")
+    ap.add_argument("--peers", type=int)
+    ap.add_argument("--jobs", type=int)
+    ap.add_argument("--seed", type=int)
+    ap.add_argument("--baseline", default=str(BASELINE))
+    ap.add_argument("--save-baseline", action="store_true")
+    args = ap.parse_args()
+
+    names = list(SCENARIOS) if args.scenario == "all" else [args.scenario]
+    overrides = {k: getattr(args, k) for k in ("peers", "jobs", "seed") if getattr(args, k) is not None}
+    base_path = Path(args.baseline)
+    baseline = json.loads(base_path.read_text()) if base_path.exists() else {}
+    results = {}
+    for name in names:
+        t = time.perf_counter()
+        r = results[name] = simulate(replace(SCENARIOS[name], **overrides))
+        print(f"[{name}] {r['committed']}/{r['jobs']} committed in {time.perf_counter() - t:.1f}s wall")
+        if name in baseline and not args.save_baseline:
+            compare(r, baseline[name])
+        else:
+            for k, v in r.items(): print(f"  {k:<22}{v:>12}")
+    if args.save_baseline:
+        base_path.parent.mkdir(parents=True, exist_ok=True)
+        base_path.write_text(json.dumps({**baseline, **results}, indent=2) + "\n")
+        print(f"baseline → {base_path}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,188 @@
+"""
+MIT – fast-restart snapshots of RingScheduler state
+Emmanuel Dessallien 2024
+
+Two files, same split as credit.ledger (small rewritten state + append-only bulk):
+  <path>              snapshot: jobs (assignments, votes, partial results),
+                      peer metadata (latency history, resident shards), credits
+  <path>.<gen>.blobs  activation blobs, appended once per job and referenced by
+                      (offset, length); rewritten under a new generation once
+                      dead blobs outweigh live ones
+
+A pass encodes `chunk` jobs at a time and yields to the loop between chunks;
+file writes and fsyncs run in the default executor. In-flight replicas are
+not kept: restored jobs wait in the queue with the votes they already had,
+and rejoining peers get their latency history and resident shards back.
+
+    snap = Snapshotter(sched, "sched.snap")
+    await snap.restore()
+    snap.start()                 # every `interval` s
+    ...
+    await snap.close()           # final snapshot on shutdown
+"""
+import asyncio, math, os, struct, time
+from typing import Dict, Tuple
+from scheduler.ring_scheduler import RingScheduler, TileJob, Peer
+
+MAGIC, VERSION = b"TTSS", 1
+HDR = struct.Struct(">4sHIdIII")       # magic | version | blob gen | wall time | peers | credits | jobs
+PEER = struct.Struct(">fffddddH")      # sram | upload | watts | srtt | rttvar | rtt | compute | shards
+SHARD = struct.Struct(">Ii")           # model_id | layer
+JOB = struct.Struct(">IIiQIdBBB")      # model | tile | layer | blob off | blob len | age | assigned | results | payloads
+STR = struct.Struct(">H")
+F64 = struct.Struct(">d")
+U8, U32 = struct.Struct(">B"), struct.Struct(">I")
+
+def _s(text: str) -> bytes:
+    b = text.encode()
+    return STR.pack(len(b)) + b
+
+def _opt(v) -> float:
+    return math.nan if v is None else v
+
+def _unopt(v: float):
+    return None if math.isnan(v) else v
+
+class _Reader:
+    def __init__(self, buf: bytes):
+        self.buf, self.p = buf, 0
+
+    def take(self, st: struct.Struct) -> tuple:
+        v = st.unpack_from(self.buf, self.p)
+        self.p += st.size
+        return v
+
+    def raw(self, n: int) -> bytes:
+        self.p += n
+        return self.buf[self.p - n:self.p]
+
+    def str(self) -> str:
+        return self.raw(self.take(STR)[0]).decode()
+
+class Snapshotter:
+    def __init__(self, sched: RingScheduler, path: str = "sched.snap", interval: float = 5.0, chunk: int = 256):
+        self.sched, self.path = sched, str(path)
+        self.interval = interval
+        self.chunk = chunk                  # jobs encoded between yields to the loop
+        self.gen = 0
+        self._blobs: Dict[Tuple[int,int,int], Tuple[int,int,TileJob]] = {}   # job key -> (offset, length, job) in the blob file
+        self._end = 0
+        self._lock = asyncio.Lock()
+        self._task = None
+        self.taken = 0
+
+    # ---------- public API ----------
+    def start(self):
+        self._task = asyncio.get_running_loop().create_task(self._run())
+
+    async def close(self):
+        if self._task: self._task.cancel()
+        await self.snapshot()
+
+    async def snapshot(self):
+        async with self._lock:
+            sched, now = self.sched, self.sched._now()
+            jobs = list(sched.index.values())
+            ref = sum(size for key, (_, size, job) in self._blobs.items() if sched.index.get(key) is job)
+            compact = self._end - ref > max(ref, 1 << 20)      # rewrite once dead blobs outweigh live ones
+            gen, end = (self.gen + 1, 0) if compact else (self.gen, self._end)
+            live, new, parts = {}, [], []
+            for i, j in enumerate(jobs):
+                if i and i % self.chunk == 0: await asyncio.sleep(0)
+                if j.committed is not None or sched.index.get(j.key) is not j: continue
+                # match the job itself, not just its key (step_ids wrap, and restore hands out fresh ones)
+                loc = None if compact else self._blobs.get(j.key)
+                if loc is None or loc[2] is not j:
+                    loc = (end, len(j.act_blob), j)
+                    end += len(j.act_blob)
+                    new.append(j.act_blob)
+                live[j.key] = loc
+                parts.append(self._enc_job(j, loc, now - j.queued_at))
+            peers = {pid: (p, list(sched.shards.resident.get(pid, ()))) for pid, p in sched.peers.items()}
+            for pid, entry in sched.restored.items(): peers.setdefault(pid, entry)
+            head = [HDR.pack(MAGIC, VERSION, gen, time.time(), len(peers), len(sched.credits), len(parts))]
+            head += [self._enc_peer(p, shards) for p, shards in peers.values()]
+            head += [_s(pid) + F64.pack(c) for pid, c in sched.credits.items()]
+            await asyncio.get_running_loop().run_in_executor(
+                None, self._write, gen, compact, new, b"".join(head + parts))
+            old_gen, self.gen, self._blobs, self._end = self.gen, gen, live, end
+            if compact and old_gen != gen:
+                try: os.remove(self._blob_path(old_gen))
+                except FileNotFoundError: pass
+            self.taken += 1
+
+    async def restore(self) -> int:
+        """Load the last snapshot into the scheduler; returns the number of jobs restored."""
+        if not os.path.exists(self.path): return 0
+        with open(self.path, "rb") as f: r = _Reader(f.read())
+        magic, version, gen, _, n_peers, n_credits, n_jobs = r.take(HDR)
+        if magic != MAGIC or version != VERSION: raise ValueError(f"{self.path}: not a v{VERSION} scheduler snapshot")
+        blob_path = self._blob_path(gen)
+        with open(blob_path, "rb") as f: blobs = f.read()
+        sched, now = self.sched, self.sched._now()
+        for _ in range(n_peers):
+            pid = r.str()
+            sram, up, watts, srtt, rttvar, rtt, compute, n = r.take(PEER)
+            p = Peer(pid, None, sram_mb=sram, upload_mbps=up, watts=watts, srtt=_unopt(srtt),
+                     rttvar=rttvar, rtt=_unopt(rtt), compute=_unopt(compute))
+            sched.restored[pid] = (p, [r.take(SHARD) for _ in range(n)])
+        for _ in range(n_credits):
+            pid = r.str()
+            sched.credits[pid] = r.take(F64)[0]
+        for _ in range(n_jobs):
+            model, tile, layer, off, size, age, n_assigned, n_results, n_payloads = r.take(JOB)
+            # outstanding replicas died with the old process: a fresh step_id keeps any stray result out
+            job = TileJob(tile, model, blobs[off:off + size], None if layer < 0 else layer, queued_at=now - age,
+                          step_id=sched._next_step())
+            job.assigned = [(r.str(), r.take(U8)[0]) for _ in range(n_assigned)]
+            for _ in range(n_results):
+                pid, digest = r.str(), r.raw(16)
+                job.results[pid] = digest
+                job.tally[digest] = job.tally.get(digest, 0) + 1
+            for _ in range(n_payloads):
+                digest = r.raw(16)
+                job.payloads[digest] = r.raw(r.take(U32)[0])
+            sched.index[job.key] = job
+            sched.jobs.append(job)
+            self._blobs[job.key] = (off, size, job)
+        self.gen, self._end = gen, os.path.getsize(blob_path)   # the tail past the snapshot is dead, not corrupt
+        return n_jobs
+
+    # ---------- internals ----------
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            await asyncio.shield(self.snapshot())   # close() must not cut a pass off between its two writes
+
+    def _blob_path(self, gen: int) -> str:
+        return f"{self.path}.{gen}.blobs"
+
+    @staticmethod
+    def _enc_job(j: TileJob, loc: Tuple[int,int,TileJob], age: float) -> bytes:
+        # only answered replicas survive a restart; outstanding ones are re-dispatched
+        assigned = [(pid, i) for pid, i in j.assigned if pid in j.results]
+        parts = [JOB.pack(j.model_id, j.tile_id, -1 if j.layer is None else j.layer, loc[0], loc[1], age,
+                          len(assigned), len(j.results), len(j.payloads))]
+        parts += [_s(pid) + U8.pack(i) for pid, i in assigned]
+        parts += [_s(pid) + d for pid, d in j.results.items()]
+        parts += [d + U32.pack(len(b)) + b for d, b in j.payloads.items()]
+        return b"".join(parts)
+
+    @staticmethod
+    def _enc_peer(p: Peer, shards) -> bytes:
+        head = PEER.pack(p.sram_mb, p.upload_mbps, p.watts, _opt(p.srtt), p.rttvar, _opt(p.rtt),
+                         _opt(p.compute), len(shards))
+        return _s(p.peer_id) + head + b"".join(SHARD.pack(*s) for s in shards)
+
+    def _write(self, gen: int, compact: bool, blobs, snap: bytes):
+        # blobs first, then the snapshot that points at them: a crash leaves at worst an unreferenced tail
+        with open(self._blob_path(gen), "wb" if compact else "ab") as f:
+            for b in blobs: f.write(b)
+            f.flush()
+            os.fsync(f.fileno())
+        tmp = self.path + ".tmp"
+        with open(tmp, "wb") as f:
+            f.write(snap)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self.path)
@@ -0,0 +1,54 @@
+"""
+MIT – numeric-tolerance voting for float tile results
+Emmanuel Dessallien 2024
+
+Browser GPUs disagree in the last ulp, so byte-exact voting rarely reaches
+quorum. Here results are decoded as float arrays and compared pairwise in
+one vectorized pass; a result is a valid representative when at least
+`min_votes` results (itself included) match it within atol + rtol*|x|.
+"""
+from typing import Optional, Sequence
+from collections import Counter, defaultdict
+import numpy as np
+
+def agreement(arr: np.ndarray, atol: float, rtol: float) -> np.ndarray:
+    """(n, L) results -> (n, n) bool matrix of element-wise closeness.
+
+    Non-finite values only match themselves (inf with the same inf, NaN
+    with NaN), so a deterministic NaN/Inf tile still reaches quorum.
+    """
+    a, b = arr[:, None, :], arr[None, :, :]
+    with np.errstate(invalid="ignore", over="ignore"):
+        close = np.abs(a - b) <= atol + rtol * np.maximum(np.abs(a), np.abs(b))
+    same = (a == b) | (np.isnan(a) & np.isnan(b))
+    return np.where(np.isfinite(a) & np.isfinite(b), close, same).all(axis=2)
+
+def tolerant_quorum(blobs: Sequence[bytes], min_votes: int, atol: float = 1e-5,
+                    rtol: float = 1e-5, dtype=np.float32,
+                    counts: Optional[Sequence[int]] = None) -> Optional[bytes]:
+    """Representative blob of the largest agreeing cluster, or None without quorum.
+
+    `counts` gives the number of identical votes behind each blob when the
+    caller has already collapsed byte-identical results.
+    """
+    itemsize = np.dtype(dtype).itemsize
+    if counts is None: counts = [1] * len(blobs)
+    groups = defaultdict(list)          # different lengths can never agree
+    for b, n in zip(blobs, counts):
+        groups[len(b)].append((b, n))
+    best, best_votes = None, 0
+    for size, group in groups.items():
+        if sum(n for _, n in group) < min_votes: continue
+        if size % itemsize:
+            # not a float payload: fall back to byte-exact voting
+            tally = Counter()
+            for b, n in group: tally[b] += n
+            blob, n = tally.most_common(1)[0]
+            if n > best_votes: best, best_votes = blob, n
+            continue
+        arr = np.stack([np.frombuffer(b, dtype=dtype) for b, _ in group])
+        votes = agreement(arr, atol, rtol) @ np.array([n for _, n in group])
+        i = int(votes.argmax())
+        if votes[i] > best_votes:
+            best, best_votes = group[i][0], int(votes[i])
+    return best if best_votes >= min_votes else None
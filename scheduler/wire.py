@@ -0,0 +1,156 @@
+"""
+MIT – Python side of the wire.js TLV framing
+Emmanuel Dessallien 2024
+
+Frame (big-endian):
+u8 version | u8 msg_type | u16 header_len | u32 body_len | header | body
+msg_type: 1 = ACTV_MSG, 2 = RESULT_MSG, 3 = BATCH_MSG
+ACTV header:   u32 session_id | u32 step_id | u32 tile_id | u8[16] checksum128
+RESULT header: u32 session_id | u32 step_id | u32 tile_id | u8 vote_group | u8[16] checksum128
+BATCH header:  u16 count; body = `count` complete ACTV or RESULT frames back to back
+
+Decoders never copy: `body` is a memoryview slice of the received frame.
+"""
+import struct
+import numpy as np
+from typing import List, NamedTuple
+
+VERSION = 1
+MT_ACTV, MT_RESULT, MT_BATCH = 1, 2, 3
+
+FRAME = struct.Struct(">BBHI")
+ACTV_HDR = struct.Struct(">III16s")
+RESULT_HDR = struct.Struct(">IIIB16s")
+BATCH_HDR = struct.Struct(">H")
+
+_M32, _PRIME = 0xFFFFFFFF, 0x01000193
+_SEEDS = (0x811c9dc5, 0x9e3779b9, 0x85ebca6b, 0xc2b2ae35)
+_SHORT, _BLOCK = 256, 16384             # below _SHORT bytes the plain loop is cheaper than NumPy setup
+_REP = np.uint64(0x0001000100010001)    # one 16-bit lane per seed
+_LANES = np.array([0, 16, 32, 48], np.uint64)
+_POW = np.cumprod(np.full(_BLOCK, _PRIME, np.uint64))[::-1].copy()   # P^_BLOCK .. P^1 mod 2^64
+
+class Actv(NamedTuple):
+    session_id: int
+    step_id: int
+    tile_id: int
+    c128: bytes
+    body: memoryview
+
+class Result(NamedTuple):
+    session_id: int
+    step_id: int
+    tile_id: int
+    vote_group: int
+    c128: bytes
+    body: memoryview
+
+def checksum128(data) -> bytes:
+    """FNV-1a 32 under four seeds → 16 bytes; same output as wire.js checksum128."""
+    mv = memoryview(data).cast("B")
+    if len(mv) < _SHORT: return _checksum128_py(mv)
+    b8 = np.frombuffer(mv, np.uint8)
+    h = np.array(_SEEDS, np.uint64)
+    for s in range(0, len(b8), _BLOCK):
+        h = _fnv_block(h, b8[s:s + _BLOCK])
+    return struct.pack(">IIII", *(int(v) & _M32 for v in h))
+
+def _checksum128_py(mv) -> bytes:
+    h1, h2, h3, h4 = _SEEDS
+    for b in mv:
+        h1 = ((h1 ^ b) * _PRIME) & _M32
+        h2 = ((h2 ^ b) * _PRIME) & _M32
+        h3 = ((h3 ^ b) * _PRIME) & _M32
+        h4 = ((h4 ^ b) * _PRIME) & _M32
+    return struct.pack(">IIII", h1, h2, h3, h4)
+
+def _fnv_block(h: np.ndarray, b: np.ndarray) -> np.ndarray:
+    # h ^ b only touches the low byte, so with d_i = (h_i ^ b_i) - h_i:
+    #   h_n = P^n h_0 + sum_i d_i P^(n-i)            (mod 2^32, one dot product)
+    # and d_i needs only the low-byte sequence l_i. Bit k of l_{i+1} is bit k of l_i ^ b_i,
+    # flipped by bit k of ((l_i ^ b_i) mod 2^k) * P, so given bits < k for every i, bit k of
+    # the whole sequence is a prefix XOR. 8 such passes; the four seeds run as 16-bit lanes.
+    n = len(b)
+    start = sum((int(v) & 0xFF) << (16 * i) for i, v in enumerate(h))
+    B = b.astype(np.uint64)
+    B *= _REP
+    lo = np.zeros(n, np.uint64)
+    lo[0] = start
+    t = np.empty(n, np.uint64)
+    for k in range(8):
+        np.bitwise_xor(lo, B, out=t)
+        t &= np.uint64(((1 << k) - 1) * int(_REP))
+        t *= np.uint64(_PRIME & 0xFF)       # lane products stay < 2^15
+        t ^= B
+        t >>= np.uint64(k)
+        t &= _REP
+        t[0] ^= np.uint64((start >> k) & int(_REP))
+        np.bitwise_xor.accumulate(t, out=t)
+        t <<= np.uint64(k)
+        lo[1:] |= t[:-1]
+    l = (lo[:, None] >> _LANES) & np.uint64(0xFF)
+    d = (l ^ b[:, None]) - l                # negative deltas wrap mod 2^64, harmless mod 2^32
+    pw = _POW[_BLOCK - n:]
+    return h * pw[0] + pw @ d
+
+def _frame(msg_type: int, hdr: struct.Struct, body) -> bytearray:
+    body = memoryview(body).cast("B")
+    buf = bytearray(FRAME.size + hdr.size + len(body))
+    FRAME.pack_into(buf, 0, VERSION, msg_type, hdr.size, len(body))
+    buf[FRAME.size + hdr.size:] = body
+    return buf
+
+def _open(buf, msg_type: int, name: str):
+    mv = memoryview(buf).cast("B")
+    ver, mt, hlen, blen = FRAME.unpack_from(mv, 0)
+    if ver != VERSION or mt != msg_type: raise ValueError(f"not {name}")
+    start = FRAME.size + hlen
+    if start + blen > len(mv): raise ValueError(f"truncated {name}")
+    return mv, mv[start:start + blen]
+
+# ---- ACTV_MSG ----
+def enc_actv(session_id: int, step_id: int, tile_id: int, act_bytes, c128: bytes = None) -> bytearray:
+    """`c128` may be passed in to reuse a checksum computed for an earlier replica."""
+    buf = _frame(MT_ACTV, ACTV_HDR, act_bytes)
+    ACTV_HDR.pack_into(buf, FRAME.size, session_id, step_id, tile_id, c128 or checksum128(act_bytes))
+    return buf
+
+def dec_actv(buf) -> Actv:
+    mv, body = _open(buf, MT_ACTV, "ACTV")
+    return Actv(*ACTV_HDR.unpack_from(mv, FRAME.size), body)
+
+# ---- RESULT_MSG ----
+def enc_result(session_id: int, step_id: int, tile_id: int, result_bytes, vote_group: int = 0, c128: bytes = None) -> bytearray:
+    buf = _frame(MT_RESULT, RESULT_HDR, result_bytes)
+    RESULT_HDR.pack_into(buf, FRAME.size, session_id, step_id, tile_id, vote_group, c128 or checksum128(result_bytes))
+    return buf
+
+def dec_result(buf) -> Result:
+    mv, body = _open(buf, MT_RESULT, "RESULT")
+    return Result(*RESULT_HDR.unpack_from(mv, FRAME.size), body)
+
+# ---- BATCH_MSG ----
+def enc_batch(frames) -> bytearray:
+    """Coalesce several frames into one data-channel message."""
+    body = b"".join(frames)
+    buf = _frame(MT_BATCH, BATCH_HDR, body)
+    BATCH_HDR.pack_into(buf, FRAME.size, len(frames))
+    return buf
+
+def dec_batch(buf) -> List[memoryview]:
+    mv, body = _open(buf, MT_BATCH, "BATCH")
+    (count,), out, p = BATCH_HDR.unpack_from(mv, FRAME.size), [], 0
+    for _ in range(count):
+        _, _, hlen, blen = FRAME.unpack_from(body, p)
+        end = p + FRAME.size + hlen + blen
+        if end > len(body): raise ValueError("truncated BATCH")
+        out.append(body[p:end])
+        p = end
+    return out
+
+def unbatch(buf) -> List[memoryview]:
+    """The frames carried by `buf`: its members if it is a BATCH, else just itself."""
+    return dec_batch(buf) if msg_type(buf) == MT_BATCH else [memoryview(buf).cast("B")]
+
+def msg_type(buf) -> int:
+    return memoryview(buf)[1]
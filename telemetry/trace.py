@@ -0,0 +1,60 @@
+"""
+MIT – sampled job-lifecycle tracing, Chrome trace-event export
+Emmanuel Dessallien 2024
+
+A Tracer keeps the last `capacity` events in a ring buffer; `dump()` writes
+them as Chrome trace-event JSON (load in chrome://tracing or ui.perfetto.dev).
+Each sampled TileJob gets its own row (pid = model_id, tid = tile_id): its
+queue waits, peer picks and overall lifetime are complete ("X") spans, and
+each replica is an async span so concurrent replicas don't have to nest.
+Timestamps come from the caller (the scheduler passes loop time).
+
+    tracer = Tracer(sample_rate=0.01)
+    sched = RingScheduler(tracer=tracer)
+    ...
+    tracer.dump("trace.json")
+"""
+import itertools, json, random
+from collections import deque
+from typing import Dict, List
+
+class Tracer:
+    def __init__(self, sample_rate: float = 1.0, capacity: int = 100_000):
+        self.sample_rate = sample_rate   # fraction of jobs traced
+        self.buf = deque(maxlen=capacity)
+        self._ids = itertools.count()    # per replica: re-dispatches to the same peer get distinct async ids
+
+    def sample(self) -> bool:
+        """Decide once per job, at enqueue; untraced jobs cost one attribute check per hook."""
+        return self.sample_rate > 0 and (self.sample_rate >= 1 or random.random() < self.sample_rate)
+
+    def span(self, name: str, job, start: float, end: float, **args):
+        self.buf.append(("X", name, start, end - start, job.model_id, job.tile_id, None, args))
+
+    def instant(self, name: str, job, ts: float, **args):
+        self.buf.append(("i", name, ts, 0.0, job.model_id, job.tile_id, None, args))
+
+    def replica(self, job, peer_id: str, start: float, end: float, **args):
+        id_ = f"{job.model_id}/{job.tile_id}/{peer_id}#{next(self._ids)}"
+        self.buf.append(("b", "replica", start, 0.0, job.model_id, job.tile_id, id_, args))
+        self.buf.append(("e", "replica", end, 0.0, job.model_id, job.tile_id, id_, {}))
+
+    def events(self) -> List[Dict]:
+        out = []
+        for ph, name, ts, dur, pid, tid, id_, args in list(self.buf):
+            ev = {"name": name, "ph": ph, "ts": ts * 1e6, "pid": pid, "tid": tid, "args": args}
+            if ph == "X": ev["dur"] = dur * 1e6
+            elif ph == "i": ev["s"] = "t"
+            else: ev["cat"], ev["id"] = "replica", id_
+            out.append(ev)
+        return out
+
+    def dump(self, path: str):
+        with open(path, "w") as f:
+            json.dump({"traceEvents": self.events(), "displayTimeUnit": "ms"}, f)
+
+    def clear(self):
+        self.buf.clear()
+
+# tracing off: sample() is always False, so no other method is reached
+NULL = Tracer(sample_rate=0.0, capacity=1)
@@ -1,116 +1,172 @@
 #!/usr/bin/env python3
 """
 verify_weights.py - Check if weight files are correct format and size
+
+Walks every tensor referenced by assets/weights/manifest*.json (per-tensor
+.bin URLs and "pack" sections), memory-maps each file and computes all
+stats in one chunked pass with bounded RAM, spreading files over a process
+pool. Also checks (or with --write-hashes, writes) checksums.json, a
+content-hash manifest of every weight file.
 """
 import os
+import json
+import hashlib
+import argparse
 import numpy as np
 from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+HASH_FILE = "checksums.json"
 
-def check_file(path, expected_shape=None, expected_bytes=None):
-    """Check if a weight file exists and has correct size"""
+def expected_shapes(dims):
+    """Tensor name (without layerN_ prefix) -> expected shape"""
+    D = dims.get("dModel") or dims["nEmbd"]
+    V = dims.get("vocab") or dims["vocabSize"]
+    L = dims["maxSeq"]
+    H = dims.get("mlpHidden", 4 * D)
+    return {
+        "wte": (V, D), "wpe": (L, D),                # 50257 × 768, 1024 × 768
+        "ln_f_g": (D,), "ln_f_b": (D,),
+        "ln1_g": (D,), "ln1_b": (D,), "ln2_g": (D,), "ln2_b": (D,),
+        "qkv": (3*D, D), "qkv_b": (3*D,),            # stored [out, in]
+        "o": (D, D), "o_b": (D,),
+        "ff1": (H, D), "ff1_b": (H,),
+        "ff2": (D, H), "ff2_b": (D,),
+    }
+
+def collect_tensors(base_path):
+    """file -> [(name, offset, nbytes or None, expected_shape)] from every manifest"""
+    main = json.loads((base_path / "manifest.json").read_text())
+    shapes = expected_shapes(main["dims"])
+    files = {}
+    for mpath in sorted(base_path.glob("manifest*.json")):
+        m = json.loads(mpath.read_text())
+        for name, url in m.get("tensors", {}).items():
+            path = base_path / url.rsplit("/", 1)[-1]
+            key = name.split("_", 1)[1] if name.startswith("layer") else name
+            files.setdefault(str(path), {}).setdefault(0, (name, None, shapes.get(key)))
+        pack = m.get("pack")
+        if pack:
+            path = base_path / pack["url"].rsplit("/", 1)[-1]
+            for name, e in pack["tensors"].items():
+                files.setdefault(str(path), {})[e["offset"]] = (name, e["nbytes"], tuple(e["shape"]))
+    # keyed by offset: the same .bin is listed by both manifest.json and manifest_layerN.json
+    return {f: [(n, off, nb, shape) for off, (n, nb, shape) in t.items()] for f, t in files.items()}
+
+def scan(path, tensors, chunk_floats):
+    """One pass over a file: per-tensor stats plus a whole-file content hash"""
     if not os.path.exists(path):
-        return f"❌ MISSING: {path}"
-    
+        return path, None, [f"❌ MISSING: {path}"]
     size = os.path.getsize(path)
-    
-    # Try to load as float32 array
-    try:
-        arr = np.fromfile(path, dtype=np.float32)
-        
-        # Check for common issues
-        if np.all(arr == 0):
-            return f"⚠️  ALL ZEROS: {path} ({size:,} bytes)"
-        if np.any(np.isnan(arr)):
-            return f"❌ CONTAINS NaN: {path}"
-        if np.any(np.isinf(arr)):
-            return f"❌ CONTAINS INF: {path}"
-        
-        # Check expected size
-        if expected_bytes and size != expected_bytes:
-            return f"⚠️  WRONG SIZE: {path} ({size:,} bytes, expected {expected_bytes:,})"
-        
-        # Check expected shape
-        if expected_shape:
-            expected_len = np.prod(expected_shape)
-            if len(arr) != expected_len:
-                return f"⚠️  WRONG SHAPE: {path} (got {len(arr)} floats, expected {expected_len})"
-        
-        # Check value ranges (should be reasonable for neural net weights)
-        vmin, vmax = arr.min(), arr.max()
-        vmean, vstd = arr.mean(), arr.std()
-        
-        if abs(vmin) > 100 or abs(vmax) > 100:
-            return f"⚠️  SUSPICIOUS RANGE: {path} (min={vmin:.2f}, max={vmax:.2f})"
-        
-        return f"✅ OK: {path} ({size:,} bytes, {len(arr)} floats, mean={vmean:.4f}, std={vstd:.4f})"
-        
-    except Exception as e:
-        return f"❌ ERROR: {path} - {e}"
+    h = hashlib.blake2b(digest_size=32)
+    mm = np.memmap(path, dtype=np.uint8, mode="r") if size else np.zeros(0, np.uint8)
+    lines = []
+    for name, offset, nbytes, shape in tensors:
+        nbytes = size - offset if nbytes is None else nbytes
+        lines.append(check_tensor(path, name, mm, offset, nbytes, shape, chunk_floats))
+    # hash in file order, chunk by chunk, so RAM stays bounded
+    step = chunk_floats * 4
+    for i in range(0, size, step):
+        h.update(mm[i:i + step])
+    return path, {"bytes": size, "blake2b": h.hexdigest()}, lines
+
+def check_tensor(path, name, mm, offset, nbytes, shape, chunk_floats):
+    label = f"{os.path.basename(path)}:{name}" if nbytes != os.path.getsize(path) else str(path)
+    if nbytes % 4 or offset + nbytes > len(mm):
+        return f"❌ ERROR: {label} - {nbytes:,} bytes is not a float32 tensor inside the file"
+    n = nbytes // 4
+    if shape and n != int(np.prod(shape)):
+        return f"⚠️  WRONG SHAPE: {label} (got {n} floats, expected {int(np.prod(shape))} for {shape})"
+    arr = mm[offset:offset + nbytes].view(np.float32)
+    nonzero = nan = inf = 0
+    vmin, vmax, s, ss = np.inf, -np.inf, 0.0, 0.0
+    for i in range(0, n, chunk_floats):
+        c = arr[i:i + chunk_floats]
+        finite = np.isfinite(c)
+        nan += int(np.isnan(c).sum())
+        inf += int((~finite).sum())
+        nonzero += int(np.count_nonzero(c))
+        c = c[finite] if not finite.all() else c
+        if len(c):
+            vmin, vmax = min(vmin, float(c.min())), max(vmax, float(c.max()))
+            c64 = c.astype(np.float64)
+            s += float(c64.sum())
+            ss += float(np.dot(c64, c64))
+    inf -= nan
+    if nan:
+        return f"❌ CONTAINS NaN: {label}"
+    if inf:
+        return f"❌ CONTAINS INF: {label}"
+    if nonzero == 0:
+        return f"⚠️  ALL ZEROS: {label} ({nbytes:,} bytes)"
+    vmean = s / n
+    vstd = max(ss / n - vmean * vmean, 0.0) ** 0.5
+    if abs(vmin) > 100 or abs(vmax) > 100:
+        return f"⚠️  SUSPICIOUS RANGE: {label} (min={vmin:.2f}, max={vmax:.2f})"
+    return f"✅ OK: {label} ({nbytes:,} bytes, {n} floats, mean={vmean:.4f}, std={vstd:.4f})"
 
 def main():
+    ap = argparse.ArgumentParser()
+    ap.add_argument("--dir", default="./assets/weights")
+    ap.add_argument("--workers", type=int, default=None)
+    ap.add_argument("--chunk-mb", type=int, default=16, help="per-worker read chunk")
+    ap.add_argument("--write-hashes", action="store_true", help=f"(re)write {HASH_FILE} instead of checking it")
+    args = ap.parse_args()
+
     print("🔍 Torrent-Tokens Weight Verification")
     print("=" * 60)
     print()
     
-    # Expected dimensions for DistilGPT-2
-    dims = {
-        "dModel": 768,
-        "nHeads": 12,
-        "dHead": 64,
-        "mlpHidden": 3072,
-        "vocab": 50257,
-        "maxSeq": 1024
-    }
-    
-    D = dims["dModel"]
-    H = dims["mlpHidden"]
-    V = dims["vocab"]
-    L = dims["maxSeq"]
-    
-    # Define expected sizes
-    weight_files = {
-        "wte.bin": (V * D * 4, (V, D)),              # 50257 × 768
-        "wpe.bin": (L * D * 4, (L, D)),              # 1024 × 768 (optional)
-        "ln1_g.bin": (D * 4, (D,)),                  # 768
-        "ln1_b.bin": (D * 4, (D,)),                  # 768
-        "qkv.bin": (D * 3*D * 4, (D, 3*D)),          # 768 × 2304
-        "qkv_b.bin": (3*D * 4, (3*D,)),              # 2304
-        "o.bin": (D * D * 4, (D, D)),                # 768 × 768
-        "o_b.bin": (D * 4, (D,)),                    # 768
-        "ln2_g.bin": (D * 4, (D,)),                  # 768
-        "ln2_b.bin": (D * 4, (D,)),                  # 768
-        "ff1.bin": (D * H * 4, (D, H)),              # 768 × 3072
-        "ff1_b.bin": (H * 4, (H,)),                  # 3072
-        "ff2.bin": (H * D * 4, (H, D)),              # 3072 × 768
-        "ff2_b.bin": (D * 4, (D,)),                  # 768
-    }
-    
-    base_path = Path("./assets/weights")
+    base_path = Path(args.dir)
     
-    if not base_path.exists():
-        print(f"❌ ERROR: Directory not found: {base_path}")
+    if not (base_path / "manifest.json").exists():
+        print(f"❌ ERROR: {base_path / 'manifest.json'} not found")
         print("   Make sure you're running this from the project root.")
         return
     
-    print("Checking weight files:")
+    files = collect_tensors(base_path)
+    print(f"Checking {sum(len(t) for t in files.values())} tensors in {len(files)} files:")
     print()
     
     total_size = 0
     errors = 0
     warnings = 0
+    hashes = {}
+    chunk = args.chunk_mb * 1024 * 1024 // 4
+    
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futures = [pool.submit(scan, path, tensors, chunk) for path, tensors in sorted(files.items())]
+        for fut in futures:
+            path, digest, lines = fut.result()
+            for result in lines:
+                print(result)
+                if "❌" in result:
+                    errors += 1
+                elif "⚠️" in result:
+                    warnings += 1
+            if digest:
+                hashes[os.path.basename(path)] = digest
+                total_size += digest["bytes"]
     
-    for filename, (expected_bytes, expected_shape) in weight_files.items():
-        filepath = base_path / filename
-        result = check_file(filepath, expected_shape, expected_bytes)
-        print(result)
-        
-        if "❌" in result:
-            errors += 1
-        elif "⚠️" in result:
+    print()
+    hash_path = base_path / HASH_FILE
+    if args.write_hashes:
+        hash_path.write_text(json.dumps(hashes, indent=2, sort_keys=True))
+        print(f"📝 Wrote {hash_path} ({len(hashes)} files)")
+    elif hash_path.exists():
+        known = json.loads(hash_path.read_text())
+        bad = [f for f, d in hashes.items() if f in known and known[f] != d]
+        for f in bad:
+            print(f"❌ HASH MISMATCH: {f}")
+        errors += len(bad)
+        unknown = [f for f in hashes if f not in known]
+        if unknown:
+            print(f"⚠️  {len(unknown)} file(s) not in {HASH_FILE}")
             warnings += 1
-        
-        if os.path.exists(filepath):
-            total_size += os.path.getsize(filepath)
+        if not bad:
+            print(f"✅ Content hashes match {HASH_FILE}")
+    else:
+        print(f"ℹ️  No {HASH_FILE}; run with --write-hashes to create one")
     
     print()
     print("=" * 60)
@@ -136,7 +192,6 @@ def main():
             
             # Try to parse it
             try:
-                import json
                 with open(vocab_path) as f:
                     vocab = json.load(f)
                 print(f"   → {len(vocab)} tokens")
@@ -151,8 +206,8 @@ def main():
         if merges_path.exists():
             size = os.path.getsize(merges_path)
             with open(merges_path) as f:
-                lines = f.readlines()
-            print(f"✅ merges.txt ({size:,} bytes, {len(lines)} lines)")
+                lines = sum(1 for _ in f)
+            print(f"✅ merges.txt ({size:,} bytes, {lines} lines)")
         else:
             print(f"❌ merges.txt not found")
             errors += 1
@@ -170,7 +225,7 @@ def main():
     print()
     print("Next steps:")
     print("1. If all OK: Run 'npm start' and open http://localhost:8080/test_local.html")
-    print("2. If errors: Re-export weights using 'python scripts/export_hf_to_bins.py'")
+    print("2. If errors: Re-export weights using 'python export_gpt2_full.py'")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
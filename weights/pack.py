@@ -0,0 +1,102 @@
+"""
+MIT – packed, mmap-able weight container
+Emmanuel Dessallien 2024
+
+One file per layer (or model) instead of one fetch per tensor:
+
+    b"TTWP" | u32 version | u32 index_len | index JSON | pad | tensor data ...
+
+All integers little-endian. The index is
+{"align": A, "tensors": {name: {"dtype": "<f4", "shape": [...], "offset": o, "nbytes": n}}}
+with absolute file offsets, each a multiple of A (256 = WebGPU's storage
+buffer offset alignment), so clients can fetch the whole file once and bind
+sub-ranges, or issue HTTP range reads per tensor.
+"""
+import json, mmap, struct
+import numpy as np
+from typing import Dict, Tuple
+
+MAGIC = b"TTWP"
+VERSION = 1
+ALIGN = 256
+PREFIX = struct.Struct("<4sII")
+
+def _up(n: int, a: int) -> int:
+    return -(-n // a) * a
+
+def layout(tensors: Dict[str, np.ndarray], align: int = ALIGN) -> Dict:
+    """Index for `tensors` (insertion order is file order)."""
+    entries = {name: {"dtype": a.dtype.str, "shape": list(a.shape), "nbytes": a.nbytes} for name, a in tensors.items()}
+    # the index length depends on the offsets it contains: iterate until it stops growing
+    data_start = 0
+    while True:
+        off = data_start
+        for e in entries.values():
+            e["offset"] = off
+            off = _up(off + e["nbytes"], align)
+        raw = json.dumps({"align": align, "tensors": entries}, separators=(",", ":")).encode()
+        need = _up(PREFIX.size + len(raw), align)
+        if need == data_start: return {"align": align, "tensors": entries}
+        data_start = need
+
+def write_pack(path, tensors: Dict[str, np.ndarray], align: int = ALIGN) -> Dict:
+    """Write `tensors` into one aligned container; returns its index."""
+    tensors = {name: np.ascontiguousarray(a, dtype=a.dtype.newbyteorder("<")) for name, a in tensors.items()}
+    index = layout(tensors, align)
+    raw = json.dumps(index, separators=(",", ":")).encode()
+    with open(path, "wb") as f:
+        f.write(PREFIX.pack(MAGIC, VERSION, len(raw)))
+        f.write(raw)
+        for name, a in tensors.items():
+            f.seek(index["tensors"][name]["offset"])
+            f.write(a.tobytes())
+        f.truncate(f.tell())
+    return index
+
+def read_index(buf) -> Tuple[Dict, int]:
+    """(index, header_bytes) from the head of a pack (a file prefix is enough)."""
+    magic, version, n = PREFIX.unpack_from(buf, 0)
+    if magic != MAGIC or version != VERSION: raise ValueError("not a weight pack")
+    return json.loads(bytes(buf[PREFIX.size:PREFIX.size + n])), PREFIX.size + n
+
+def load_index(path) -> Dict:
+    """Index of a pack on disk, reading only its header."""
+    with open(path, "rb") as f:
+        head = f.read(PREFIX.size)
+        _, _, n = PREFIX.unpack(head)
+        return read_index(head + f.read(n))[0]
+
+class WeightPack:
+    """Read-only view over a pack; tensors are zero-copy NumPy views of the mmap."""
+    def __init__(self, path):
+        self.path = path
+        with open(path, "rb") as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.index, _ = read_index(self.mm)
+        self.tensors = self.index["tensors"]
+
+    def __contains__(self, name: str):
+        return name in self.tensors
+
+    def __iter__(self):
+        return iter(self.tensors)
+
+    def __getitem__(self, name: str) -> np.ndarray:
+        e = self.tensors[name]
+        dt = np.dtype(e["dtype"])
+        return np.frombuffer(self.mm, dtype=dt, count=e["nbytes"] // dt.itemsize,
+                             offset=e["offset"]).reshape(e["shape"])
+
+    def close(self):
+        self.mm.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def manifest_entries(index: Dict, url: str) -> Dict:
+    """Per-tensor range-read descriptors for a layer manifest."""
+    return {"url": url, "tensors": {name: {k: e[k] for k in ("offset", "nbytes", "dtype", "shape")}
+                                    for name, e in index["tensors"].items()}}
@@ -1,12 +1,13 @@
 // wire.js — minimal TLV binary framing for Torrent-Tokens demo
 // Frame (big-endian):
 // u8 version | u8 msg_type | u16 header_len | u32 body_len | header | body
-// msg_type: 1 = ACTV_MSG, 2 = RESULT_MSG
+// msg_type: 1 = ACTV_MSG, 2 = RESULT_MSG, 3 = BATCH_MSG
 // ACTV header:  u32 session_id | u32 step_id | u32 tile_id | u8[16] checksum128
 // RESULT header: u32 session_id | u32 step_id | u32 tile_id | u8 vote_group | u8[16] checksum128
+// BATCH header: u16 count; body = `count` complete ACTV/RESULT frames back to back
 
 export const VERSION = 1;
-export const MT = { ACTV: 1, RESULT: 2 };
+export const MT = { ACTV: 1, RESULT: 2, BATCH: 3 };
 
 // ---- simple checksum128 (FNV-1a 32 repeated 4x → 16 bytes) ----
 export function checksum128(bytes) {
@@ -95,6 +96,33 @@ export function decRESULT(buf) {
   return { session_id, step_id, tile_id, vote_group, c128: new Uint8Array(c128), body };
 }
 
+// ---- BATCH_MSG ----
+export function encBATCH(frames) {
+  const total = frames.reduce((n, f) => n + f.byteLength, 0);
+  const { buf, dv, off } = bePackHeader(2, total);
+  dv.setUint8(1, MT.BATCH);
+  dv.setUint16(off, frames.length);
+  let p = off + 2;
+  for (const f of frames) { new Uint8Array(buf, p, f.byteLength).set(new Uint8Array(f)); p += f.byteLength; }
+  return buf;
+}
+
+export function decBATCH(buf) {
+  const dv = new DataView(buf);
+  const ver = dv.getUint8(0), mt = dv.getUint8(1);
+  if (ver !== VERSION || mt !== MT.BATCH) throw new Error("not BATCH");
+  const hlen = dv.getUint16(2), count = dv.getUint16(8);
+  const frames = [];
+  let p = 8 + hlen;
+  for (let i = 0; i < count; i++) {
+    const len = 8 + dv.getUint16(p + 2) + dv.getUint32(p + 4);
+    frames.push(buf.slice(p, p + len)); p += len;
+  }
+  return frames;
+}
+
+export function msgType(buf) { return new DataView(buf).getUint8(1); }
+
 // helpers
 export function hexOf(bytes) {
   let s = ""; for (let i = 0; i < bytes.length; i++) s += bytes[i].toString(16).padStart(2,"0");
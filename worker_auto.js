@@ -1,8 +1,8 @@
 // Worker — stop WS reconnects while RTC is up; no visibility spam
 
-let decACTV = null, encRESULT = null;
+let decACTV = null, encRESULT = null, decBATCH = null, encBATCH = null, msgType = null;
 (async () => {
-  try { const mod = await import('./wire.js'); decACTV = mod.decACTV; encRESULT = mod.encRESULT; } catch {}
+  try { const mod = await import('./wire.js'); ({ decACTV, encRESULT, decBATCH, encBATCH, msgType } = mod); } catch {}
 })().catch(()=>{});
 
 const joinBtn = document.getElementById("join");
@@ -199,11 +199,19 @@ document.addEventListener('visibilitychange', () => {
 });
 
 // --- channel handler
+const pending = new Set();     // "model/tile/step" received and not yet answered
+const cancelled = new Set();   // subset of pending the coordinator already committed without us
 async function onChannelMessage(ev){
   if (typeof ev.data === "string") {
     try {
       const msg = JSON.parse(ev.data);
       if (msg.test === "ping") { chan?.send(JSON.stringify({ test:"pong", from:peerId })); }
+      else if (msg.type === "ping") { chan?.send(JSON.stringify({ type:"pong", t: msg.t })); }   // scheduler heartbeat: echo its clock
+      else if (msg.type === "cancel") {
+        // most cancels arrive after we answered; only a tile still waiting here can be skipped
+        const key = `${msg.model_id}/${msg.tile_id}/${msg.step_id}`;
+        if (pending.has(key)) cancelled.add(key);
+      }
       else if (msg.type === "ACTV_JSON") {
         const act = new Uint8Array(msg.actBlob || []);
         log(`⬇️ ACTV(JSON) step ${msg.stepId} tile ${msg.tileId} bytes=${act.length}`);
@@ -215,13 +223,28 @@ async function onChannelMessage(ev){
     return;
   }
   if (decACTV && encRESULT) {
-    try { const { session_id, step_id, tile_id, body } = decACTV(ev.data);
-      log(`⬇️ ACTV(BIN) step ${step_id} tile ${tile_id} bytes=${body.length}`);
-      const resultBytes = await computeResultBytes(body);
-      const out = encRESULT({ session_id, step_id, tile_id, vote_group: 0, resultBytes });
-      chan?.send(out);
-      log(`⬆️ RESULT(BIN) step ${step_id} tile ${tile_id}`);
-    } catch (e) { log("⚠️ non-ACTV frame or parse error: " + e); }
+    let actvs = [];
+    try {
+      // a BATCH of ACTVs is answered with one BATCH of RESULTs (one data-channel message each way)
+      const batched = msgType && msgType(ev.data) === 3;
+      actvs = (batched ? decBATCH(ev.data) : [ev.data]).map(decACTV);
+      for (const a of actvs) pending.add(`${a.session_id}/${a.tile_id}/${a.step_id}`);
+      const outs = [];
+      for (const { session_id, step_id, tile_id, body } of actvs) {
+        const key = `${session_id}/${tile_id}/${step_id}`;
+        pending.delete(key);
+        if (cancelled.delete(key)) { log(`✂️ tile ${tile_id} cancelled`); continue; }
+        log(`⬇️ ACTV(BIN) step ${step_id} tile ${tile_id} bytes=${body.length}`);
+        const resultBytes = await computeResultBytes(body);
+        outs.push(encRESULT({ session_id, step_id, tile_id, vote_group: 0, resultBytes }));
+      }
+      if (!outs.length) return;
+      chan?.send(batched ? encBATCH(outs) : outs[0]);
+      log(`⬆️ RESULT(BIN) ${outs.length} tile(s)${batched ? " batched" : ""}`);
+    } catch (e) {
+      log("⚠️ non-ACTV frame or parse error: " + e);
+      for (const a of actvs) { const key = `${a.session_id}/${a.tile_id}/${a.step_id}`; pending.delete(key); cancelled.delete(key); }
+    }
   }
 }
 